@@ -0,0 +1,387 @@
+"""
+Load test the API under gunicorn against local Supabase and Stripe stubs.
+
+Run from little-jonnys-backend/:
+
+    python -m bench.run --duration 30 --concurrency 16
+    python -m bench.run --save-baseline                 # write bench/baseline.json
+    python -m bench.run --compare bench/baseline.json   # exit 1 on regressions
+
+Upstream slowness is modelled with --supabase-latency and --stripe-latency
+(seconds added to every stub response).
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+
+from bench.stubs import start_postgrest, start_stripe
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, 'bench', 'baseline.json')
+WEBHOOK_SECRET = 'whsec_bench'
+
+# Placeholder anon key; the stub doesn't check it
+SUPABASE_KEY = 'eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.bench'
+
+
+class Client:
+    """
+    A keep-alive HTTP connection to the app, one per load thread
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                return response.status, data
+            except (http.client.HTTPException, ConnectionError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+
+def _booking_form():
+    guests = random.choice([40, 60, 80, 120, 200])
+    return {
+        'name': 'Bench Customer',
+        'email': f'bench+{uuid.uuid4().hex[:8]}@example.com',
+        'phone': '07700900000',
+        'location': random.choice(['Portsmouth', 'Southsea', 'Chichester', 'Fareham']),
+        'eventDate': f'2027-0{random.randint(5, 9)}-{random.randint(10, 28)}',
+        'services': {'hogRoast': True, 'bar': random.random() < 0.5},
+        'hogRoastGuests': str(guests)
+    }
+
+
+def _quote_form():
+    return {
+        'services': {'hogRoast': True, 'pizza': random.random() < 0.5, 'bar': True, 'buffet': True},
+        'hogRoastGuests': random.randint(50, 300),
+        'pizzaGuests': random.randint(20, 150),
+        'buffetGuests': random.randint(20, 200),
+        'buffetPackage': random.choice(['package1', 'package2', 'package3'])
+    }
+
+
+def _signed_event(event):
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return payload, {'Stripe-Signature': f't={timestamp},v1={signature}', 'Content-Type': 'application/json'}
+
+
+CATALOG_PATHS = [
+    '/api/prices', '/api/prices/buffet', '/api/allergens', '/api/allergens/matrix',
+    '/api/allergens/pizza', '/api/allergens/search?exclude=gluten,dairy'
+]
+
+
+def catalog_read(client, record):
+    start = time.perf_counter()
+    status, _ = client.request('GET', random.choice(CATALOG_PATHS))
+    record('catalog_read', time.perf_counter() - start, status == 200)
+
+
+def quote(client, record):
+    start = time.perf_counter()
+    status, _ = client.request('POST', '/api/quote', _quote_form())
+    record('quote', time.perf_counter() - start, status == 200)
+
+
+def create_booking(client, record):
+    start = time.perf_counter()
+    status, _ = client.request('POST', '/api/bookings', _booking_form())
+    record('create_booking', time.perf_counter() - start, status == 201)
+
+
+def list_bookings(client, record):
+    start = time.perf_counter()
+    status, _ = client.request('GET', '/api/bookings?limit=50&fields=id,client_name,event_date,status')
+    record('list_bookings', time.perf_counter() - start, status == 200)
+
+
+_recent_checkouts = []
+
+
+def checkout(client, record):
+    # Customers retry the pay button; about half the clicks are repeats
+    if _recent_checkouts and random.random() < 0.5:
+        booking_id, amount = random.choice(_recent_checkouts)
+    else:
+        booking_id, amount = str(uuid.uuid4()), random.choice([500, 650, 820])
+        _recent_checkouts.append((booking_id, amount))
+        del _recent_checkouts[:-200]
+    body = {
+        'booking_id': booking_id,
+        'amount': amount,
+        'customer_email': 'bench@example.com',
+        'customer_name': 'Bench Customer'
+    }
+    start = time.perf_counter()
+    status, _ = client.request('POST', '/api/create-checkout-session', body)
+    record('checkout', time.perf_counter() - start, status == 200)
+
+
+def webhook_burst(client, record):
+    # Stripe delivers in bursts and retries; a fifth of deliveries repeat an event
+    events = []
+    for _ in range(5):
+        if events and random.random() < 0.2:
+            events.append(events[-1])
+            continue
+        session_id = 'cs_test_' + uuid.uuid4().hex
+        events.append({
+            'id': 'evt_' + uuid.uuid4().hex,
+            'object': 'event',
+            'type': 'checkout.session.completed',
+            'data': {'object': {
+                'id': session_id,
+                'object': 'checkout.session',
+                'amount_total': 50000,
+                'payment_status': 'paid',
+                'metadata': {'booking_id': str(uuid.uuid4())}
+            }}
+        })
+    for event in events:
+        payload, headers = _signed_event(event)
+        start = time.perf_counter()
+        status, _ = client.request('POST', '/api/webhook', payload, headers)
+        record('webhook', time.perf_counter() - start, status == 200)
+
+
+# name -> (weight, scenario)
+MIX = {
+    'catalog_read': (50, catalog_read),
+    'quote': (15, quote),
+    'create_booking': (10, create_booking),
+    'checkout': (10, checkout),
+    'webhook_burst': (5, webhook_burst),
+    'list_bookings': (5, list_bookings)
+}
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.active = False
+
+    def __call__(self, name, seconds, ok):
+        if not self.active:
+            return
+        with self.lock:
+            self.samples.setdefault(name, []).append(seconds)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarise(recorder, elapsed):
+    results = {}
+    for name, samples in sorted(recorder.samples.items()):
+        samples = sorted(samples)
+        results[name] = {
+            'count': len(samples),
+            'errors': recorder.errors.get(name, 0),
+            'rps': round(len(samples) / elapsed, 2),
+            'p50_ms': round(_percentile(samples, 50) * 1000, 2),
+            'p95_ms': round(_percentile(samples, 95) * 1000, 2),
+            'p99_ms': round(_percentile(samples, 99) * 1000, 2)
+        }
+    return results
+
+
+def print_results(results):
+    print(f"{'endpoint':<16}{'count':>8}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['count']:>8}{r['errors']:>8}{r['rps']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the change against a baseline and return the regressed endpoints
+    """
+    regressions = []
+    print(f"\n{'endpoint':<16}{'p95 base':>10}{'p95 now':>10}{'req/s base':>12}{'req/s now':>11}")
+    for name, current in results.items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        print(f"{name:<16}{base['p95_ms']:>10}{current['p95_ms']:>10}{base['rps']:>12}{current['rps']:>11}")
+        if current['p95_ms'] > base['p95_ms'] * (1 + threshold) or current['rps'] < base['rps'] * (1 - threshold):
+            regressions.append(name)
+    return regressions
+
+
+def start_app(port, env, workers, threads, worker_class='gthread'):
+    # Production settings from gunicorn.conf.py, with the sizing under test
+    command = [
+        sys.executable, '-m', 'gunicorn',
+        '--config', 'gunicorn.conf.py',
+        '--workers', str(workers),
+        '--worker-class', worker_class,
+        '--threads', str(threads),
+        '--bind', f'127.0.0.1:{port}',
+        '--log-level', 'warning'
+    ]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited during startup')
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('App did not become healthy in time')
+
+
+def _free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run(args):
+    postgrest, _, postgrest_url = start_postgrest(args.supabase_latency)
+    stripe_stub, _, stripe_url = start_stripe(args.stripe_latency)
+
+    workdir = tempfile.mkdtemp(prefix='lj-bench-')
+    env = dict(os.environ)
+    env.update({
+        'SUPABASE_URL': postgrest_url,
+        'SUPABASE_KEY': SUPABASE_KEY,
+        'STRIPE_SECRET_KEY': 'sk_test_bench',
+        'STRIPE_API_BASE': stripe_url,
+        'STRIPE_WEBHOOK_SECRET': WEBHOOK_SECRET,
+        'LOCAL_DB_PATH': os.path.join(workdir, 'app.db'),
+        'STATIC_CACHE_DIR': os.path.join(workdir, 'static'),
+        'IMAGE_CACHE_DIR': os.path.join(workdir, 'images'),
+        'GUNICORN_ACCESS_LOG': ''
+    })
+
+    port = _free_port()
+    process = start_app(port, env, args.workers, args.threads, args.worker_class)
+
+    recorder = Recorder()
+    stop = threading.Event()
+    names = list(MIX)
+    weights = [MIX[name][0] for name in names]
+
+    def load():
+        client = Client(port)
+        while not stop.is_set():
+            scenario = MIX[random.choices(names, weights)[0]][1]
+            try:
+                scenario(client, recorder)
+            except Exception:
+                recorder(scenario.__name__, 0.0, False)
+
+    threads = [threading.Thread(target=load, daemon=True) for _ in range(args.concurrency)]
+    try:
+        for thread in threads:
+            thread.start()
+        time.sleep(args.warmup)
+        recorder.active = True
+        started = time.perf_counter()
+        time.sleep(args.duration)
+        recorder.active = False
+        elapsed = time.perf_counter() - started
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=35)
+        process.terminate()
+        process.wait(timeout=30)
+
+    results = summarise(recorder, elapsed)
+    total = sum(r['count'] for r in results.values())
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s), "
+          f"{postgrest.requests} Supabase and {stripe_stub.requests} Stripe stub calls\n")
+    print_results(results)
+
+    return {
+        'meta': {
+            'duration': args.duration,
+            'concurrency': args.concurrency,
+            'workers': args.workers,
+            'threads': args.threads,
+            'worker_class': args.worker_class,
+            'supabase_latency': args.supabase_latency,
+            'stripe_latency': args.stripe_latency,
+            'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        },
+        'results': results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=20, help='seconds to measure')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds of load before measuring')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent client connections')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gunicorn worker')
+    parser.add_argument('--worker-class', default='gthread', help='gunicorn worker class')
+    parser.add_argument('--supabase-latency', type=float, default=0.03)
+    parser.add_argument('--stripe-latency', type=float, default=0.3)
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE, help='write results to this file')
+    parser.add_argument('--compare', help='baseline file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p95/throughput change before failing')
+    args = parser.parse_args()
+
+    report = run(args)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report['results'], baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print('\nNo regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Measure worker cold start: how long a fresh interpreter takes to import
+src.main and answer its first request, and which imports that time goes on.
+
+Run from little-jonnys-backend/:
+
+    python -m bench.startup                  # cold start plus the slowest imports
+    python -m bench.startup --top 40         # show more of the import profile
+    python -m bench.startup --budget 0.8     # use a tighter budget than the default
+
+Exits 1 when the median cold start is over the budget (STARTUP_BUDGET_SECONDS
+by default), so it can run as a pre-deploy check.
+
+Every run is a new process with no Supabase configured, so the numbers are
+the app's own startup cost rather than network time. Cold starts are timed
+with the production settings, including the Stripe SDK import that
+PRELOAD_IMPORTS starts on a background thread. The import profile leaves
+that import out, so it lists only what the first request waits for.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_BUDGET_SECONDS = 1.0
+
+# Runs in the child: time the import and the first request separately
+_COLD_START = """
+import json, time
+started = time.perf_counter()
+import src.main
+imported = time.perf_counter()
+response = src.main.app.test_client().get('/health')
+served = time.perf_counter()
+print(json.dumps({
+    'status': response.status_code,
+    'import_seconds': imported - started,
+    'first_request_seconds': served - imported
+}))
+"""
+
+
+def _env(workdir, preload=True):
+    env = dict(os.environ)
+    env.update({
+        # load_dotenv() doesn't override variables that are already set
+        'SUPABASE_URL': '',
+        'SUPABASE_KEY': '',
+        'PRELOAD_IMPORTS': '1' if preload else '0',
+        'LOCAL_DB_PATH': os.path.join(workdir, 'app.db'),
+        'STATIC_CACHE_DIR': os.path.join(workdir, 'static'),
+        'IMAGE_CACHE_DIR': os.path.join(workdir, 'images')
+    })
+    return env
+
+
+def cold_start(env):
+    """
+    Seconds from launching the interpreter until /health has answered
+    """
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-c', _COLD_START],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    total = time.perf_counter() - started
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    if timings['status'] != 200:
+        raise RuntimeError(f"/health answered {timings['status']}")
+    timings['total_seconds'] = total
+    return timings
+
+
+def import_profile(env):
+    """
+    Parse python -X importtime into {module: (self_us, cumulative_us)}
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import src.main'],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        profile[name.strip()] = (int(self_us), int(cumulative_us))
+    return profile
+
+
+def by_package(profile):
+    """
+    Self time summed per top-level package, e.g. all of stripe.* under stripe
+    """
+    totals = {}
+    for name, (self_us, _) in profile.items():
+        package = name.split('.')[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return totals
+
+
+def print_profile(profile, top):
+    print(f"\n{'Slowest imports':<48}{'self ms':>10}{'cumul. ms':>11}")
+    slowest = sorted(profile.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"{name:<48}{self_us / 1000:>10.1f}{cumulative_us / 1000:>11.1f}")
+
+    print(f"\n{'By package':<48}{'self ms':>10}")
+    packages = sorted(by_package(profile).items(), key=lambda item: item[1], reverse=True)[:top]
+    for package, self_us in packages:
+        print(f"{package:<48}{self_us / 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='cold starts to time (the median is reported)')
+    parser.add_argument('--top', type=int, default=20, help='imports to list in the profile')
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_SECONDS,
+                        help='fail if the median cold start takes longer (seconds, default %(default)s)')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='lj-startup-')
+    env = _env(workdir)
+    # The first run also writes bytecode caches for the app's own modules
+    cold_start(env)
+    runs = [cold_start(env) for _ in range(args.runs)]
+    profile = import_profile(_env(workdir, preload=False))
+
+    summary = {
+        key: round(statistics.median(run[key] for run in runs), 3)
+        for key in ('total_seconds', 'import_seconds', 'first_request_seconds')
+    }
+
+    if args.json:
+        print(json.dumps({
+            'cold_start': summary,
+            'imports_ms': {name: round(cumulative / 1000, 1) for name, (_, cumulative) in profile.items()},
+            'packages_ms': {name: round(self_us / 1000, 1) for name, self_us in by_package(profile).items()}
+        }, indent=2))
+    else:
+        print(f"Cold start (median of {args.runs}): {summary['total_seconds']:.3f}s total, "
+              f"{summary['import_seconds']:.3f}s importing src.main, "
+              f"{summary['first_request_seconds']:.3f}s for the first request")
+        print_profile(profile, args.top)
+
+    if summary['total_seconds'] > args.budget:
+        print(f"\nCold start {summary['total_seconds']:.3f}s is over the {args.budget:.3f}s budget", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,364 @@
+"""
+Local stand-ins for Supabase (PostgREST) and the Stripe API, used by the
+benchmark suite so load tests never touch real services.
+
+Both servers hold their data in memory and can inject a fixed latency per
+request to model a slow upstream.
+"""
+import sys
+import json
+import time
+import uuid
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# The stub serves the same catalog the app falls back to
+from src.services.catalog_seed import SEED_ALLERGENS, SEED_PRICES
+
+
+def _as_text(value):
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def _split_top_level(text):
+    """
+    Split a PostgREST logic tree on commas that aren't inside parentheses or quotes
+    """
+    parts, depth, quoted, current = [], 0, False, ''
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == '(':
+            depth += 1
+        elif not quoted and char == ')':
+            depth -= 1
+        elif not quoted and depth == 0 and char == ',':
+            parts.append(current)
+            current = ''
+            continue
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _compare(row_value, op, value):
+    if value.startswith('"') and value.endswith('"'):
+        value = value[1:-1].replace('\\"', '"')
+    text = _as_text(row_value)
+    if op == 'eq':
+        return text == value
+    if op == 'neq':
+        return text != value
+    if op == 'is':
+        return text == value
+    if op == 'in':
+        return text in [v.strip('"') for v in value.strip('()').split(',')]
+    if row_value is None:
+        return False
+    if op == 'lt':
+        return text < value
+    if op == 'lte':
+        return text <= value
+    if op == 'gt':
+        return text > value
+    if op == 'gte':
+        return text >= value
+    raise ValueError(f'Unsupported operator: {op}')
+
+
+def _logic(row, tree, combine):
+    results = []
+    for part in _split_top_level(tree):
+        if part.startswith('and(') or part.startswith('or('):
+            name, _, inner = part.partition('(')
+            results.append(_logic(row, inner[:-1], all if name == 'and' else any))
+        else:
+            column, op, value = part.split('.', 2)
+            results.append(_compare(row.get(column), op, value))
+    return combine(results)
+
+
+class PostgrestStub:
+    """
+    Just enough of PostgREST for the bookings, prices and allergens tables
+    """
+
+    RESERVED = {'select', 'order', 'limit', 'offset', 'on_conflict', 'columns', 'or'}
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.tables = {
+            'prices': [dict(row) for row in SEED_PRICES],
+            'allergens': [dict(row) for row in SEED_ALLERGENS],
+            'bookings': []
+        }
+        self.requests = 0
+
+    def _filter(self, rows, params):
+        for key, values in params.items():
+            if key in self.RESERVED:
+                continue
+            for value in values:
+                op, _, operand = value.partition('.')
+                rows = [row for row in rows if _compare(row.get(key), op, operand)]
+        if 'or' in params:
+            rows = [row for row in rows if _logic(row, params['or'][0][1:-1], any)]
+        return rows
+
+    def _order(self, rows, params):
+        if 'order' not in params:
+            return rows
+        for term in reversed(params['order'][0].split(',')):
+            column, _, direction = term.partition('.')
+            rows = sorted(rows, key=lambda row: _as_text(row.get(column)), reverse=direction.startswith('desc'))
+        return rows
+
+    def _project(self, rows, params):
+        select = params.get('select', ['*'])[0]
+        if select == '*':
+            return rows
+        columns = [c.strip('"') for c in select.split(',')]
+        return [{c: row.get(c) for c in columns} for row in rows]
+
+    def select(self, table, params):
+        with self.lock:
+            rows = self._order(self._filter(list(self.tables.get(table, [])), params), params)
+        offset = int(params.get('offset', ['0'])[0])
+        if 'limit' in params:
+            rows = rows[offset:offset + int(params['limit'][0])]
+        return self._project(rows, params)
+
+    def insert(self, table, body, prefer):
+        rows = body if isinstance(body, list) else [body]
+        inserted = []
+        with self.lock:
+            existing = {row.get('id') for row in self.tables.setdefault(table, [])}
+            for row in rows:
+                row = dict(row)
+                row.setdefault('id', str(uuid.uuid4()))
+                row.setdefault('created_at', time.strftime('%Y-%m-%dT%H:%M:%S+00:00', time.gmtime()))
+                if row['id'] in existing:
+                    if 'ignore-duplicates' in prefer:
+                        continue
+                    self.tables[table] = [r for r in self.tables[table] if r.get('id') != row['id']]
+                self.tables[table].append(row)
+                inserted.append(row)
+        return inserted
+
+    def update(self, table, params, body):
+        with self.lock:
+            rows = self._filter(self.tables.get(table, []), params)
+            for row in rows:
+                row.update(body)
+            return [dict(row) for row in rows]
+
+
+class StripeStub:
+    """
+    Checkout sessions, refunds and session listing with fake ids
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.idempotent = {}
+        self.in_flight = set()
+        self.requests = 0
+
+    def create_session(self, form):
+        session_id = 'cs_test_' + uuid.uuid4().hex
+        metadata = {key[len('metadata['):-1]: value for key, value in form.items() if key.startswith('metadata[')}
+        amount = int(form.get('line_items[0][price_data][unit_amount]', '0'))
+        session = {
+            'id': session_id,
+            'object': 'checkout.session',
+            'url': f'https://checkout.stripe.test/pay/{session_id}',
+            'status': 'open',
+            'payment_status': 'unpaid',
+            'amount_total': amount,
+            'currency': 'gbp',
+            'customer_email': form.get('customer_email'),
+            'metadata': metadata,
+            'payment_intent': 'pi_test_' + uuid.uuid4().hex,
+            'created': int(time.time()),
+            'expires_at': int(time.time()) + 24 * 3600
+        }
+        with self.lock:
+            self.sessions[session_id] = session
+        return session
+
+    def retrieve_session(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                # Pretend the customer paid as soon as we are asked
+                session.update({'status': 'complete', 'payment_status': 'paid'})
+            return session
+
+    def list_sessions(self, params):
+        with self.lock:
+            sessions = sorted(self.sessions.values(), key=lambda s: s['created'], reverse=True)
+        if 'created[gte]' in params:
+            sessions = [s for s in sessions if s['created'] >= int(params['created[gte]'][0])]
+        limit = int(params.get('limit', ['10'])[0])
+        if 'starting_after' in params:
+            ids = [s['id'] for s in sessions]
+            start = ids.index(params['starting_after'][0]) + 1 if params['starting_after'][0] in ids else len(ids)
+            sessions = sessions[start:]
+        page = sessions[:limit]
+        return {'object': 'list', 'data': page, 'has_more': len(sessions) > limit, 'url': '/v1/checkout/sessions'}
+
+    def create_refund(self, form):
+        return {
+            'id': 're_test_' + uuid.uuid4().hex,
+            'object': 'refund',
+            'amount': int(form.get('amount', '5000')),
+            'payment_intent': form.get('payment_intent'),
+            'status': 'succeeded'
+        }
+
+
+def _handler(stub, route):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _dispatch(self, method):
+            stub.requests += 1
+            if stub.latency:
+                time.sleep(stub.latency)
+            if getattr(stub, 'failing', False):
+                # Simulate an upstream outage
+                self._body()
+                self._send(503, {'message': 'Service unavailable'})
+                return
+            url = urlparse(self.path)
+            status, payload = route(method, url.path, parse_qs(url.query), self._body(), self.headers)
+            self._send(status, payload)
+
+        def do_GET(self):
+            self._dispatch('GET')
+
+        def do_HEAD(self):
+            self._dispatch('HEAD')
+
+        def do_POST(self):
+            self._dispatch('POST')
+
+        def do_PATCH(self):
+            self._dispatch('PATCH')
+
+    return Handler
+
+
+def _postgrest_route(stub):
+    def route(method, path, params, body, headers):
+        table = path.rsplit('/', 1)[-1]
+        if method in ('GET', 'HEAD'):
+            return 200, stub.select(table, params)
+        prefer = headers.get('Prefer', '')
+        if method == 'POST':
+            rows = stub.insert(table, json.loads(body or b'[]'), prefer)
+            return 201, None if 'return=minimal' in prefer else rows
+        if method == 'PATCH':
+            rows = stub.update(table, params, json.loads(body or b'{}'))
+            return 200, None if 'return=minimal' in prefer else rows
+        return 405, {'message': 'Method not allowed'}
+    return route
+
+
+def _stripe_create(stub, path, form):
+    if path == '/v1/checkout/sessions':
+        return 200, stub.create_session(form)
+    if path == '/v1/refunds':
+        return 200, stub.create_refund(form)
+    return 404, {'error': {'type': 'invalid_request_error', 'message': f'Unrecognized request URL (POST: {path})'}}
+
+
+def _stripe_route(stub):
+    def route(method, path, params, body, headers):
+        form = {key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()}
+        key = headers.get('Idempotency-Key') if method == 'POST' else None
+        if key:
+            # Like Stripe: replay a finished request, refuse a concurrent one
+            with stub.lock:
+                if key in stub.idempotent:
+                    return stub.idempotent[key]
+                if key in stub.in_flight:
+                    return 409, {'error': {
+                        'type': 'idempotency_error',
+                        'message': 'There is currently another in-progress request using this Idempotent Key'
+                    }}
+                stub.in_flight.add(key)
+            try:
+                response = _stripe_create(stub, path, form)
+                if response[0] == 200:
+                    with stub.lock:
+                        stub.idempotent[key] = response
+                return response
+            finally:
+                with stub.lock:
+                    stub.in_flight.discard(key)
+        if method == 'POST' and path in ('/v1/checkout/sessions', '/v1/refunds'):
+            return _stripe_create(stub, path, form)
+        if path == '/v1/checkout/sessions' and method == 'GET':
+            return 200, stub.list_sessions(params)
+        if path.startswith('/v1/checkout/sessions/') and method == 'GET':
+            session = stub.retrieve_session(path.rsplit('/', 1)[-1])
+            if session is None:
+                return 404, {'error': {'type': 'invalid_request_error', 'message': 'No such checkout.session'}}
+            return 200, session
+        return 404, {'error': {'type': 'invalid_request_error', 'message': f'Unrecognized request URL ({method}: {path})'}}
+    return route
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The app's workers drop pooled connections when gunicorn stops
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def serve(stub, route, port=0):
+    """
+    Start a stub on a background thread and return (server, base_url)
+    """
+    server = _StubServer(('127.0.0.1', port), _handler(stub, route(stub)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def start_postgrest(latency=0.0, port=0):
+    stub = PostgrestStub(latency)
+    server, url = serve(stub, _postgrest_route, port)
+    return stub, server, url
+
+
+def start_stripe(latency=0.0, port=0):
+    stub = StripeStub(latency)
+    server, url = serve(stub, _stripe_route, port)
+    return stub, server, url
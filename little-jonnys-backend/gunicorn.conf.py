@@ -0,0 +1,39 @@
+import os
+import multiprocessing
+
+# Production server settings. Run from little-jonnys-backend/:
+#
+#     gunicorn -c gunicorn.conf.py
+#
+# Every setting can be overridden with the environment variable next to it.
+
+wsgi_app = 'src.main:app'
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+
+# Requests spend most of their time waiting on Supabase and Stripe, so each
+# process runs many threads; a few processes spread the CPU work (JSON,
+# compression) over the cores. Each process keeps its own caches, indexes
+# and background workers, so more processes means more memory and more
+# Supabase reloads.
+workers = int(os.getenv('WEB_CONCURRENCY', str(min(multiprocessing.cpu_count() * 2, 4))))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+
+# Only used by the gevent worker class (pip install gevent)
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '500'))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# The app starts background threads when it is imported, which must happen
+# in each worker rather than once in the master
+preload_app = False
+
+# Trust X-Forwarded-* from the reverse proxy in front of us
+forwarded_allow_ips = os.getenv('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+# Set GUNICORN_ACCESS_LOG to an empty value to turn access logging off
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
@@ -0,0 +1,44 @@
+import os
+import re
+import time
+from src.services.lazy import LazyModule
+from src.services.metrics import record_upstream
+
+# Object ids in Stripe API paths, e.g. cs_test_a1B2c3 in /v1/checkout/sessions/cs_test_a1B2c3
+_STRIPE_ID = re.compile(r'/[a-z]{2,5}_[A-Za-z0-9_]+')
+
+def _instrumented_client_class(stripe):
+    # Built once the SDK is imported, since it subclasses the SDK's client
+    class InstrumentedStripeClient(stripe.RequestsClient):
+        """
+        Stripe HTTP client that times every API call, retries included
+        """
+
+        def request_with_retries(self, method, url, headers, post_data=None, max_network_retries=None, **kwargs):
+            path = _STRIPE_ID.sub('/{id}', url.split('://', 1)[-1].split('?', 1)[0].partition('/')[2])
+            operation = '/' + path
+            start = time.perf_counter()
+            try:
+                content, status, response_headers = super().request_with_retries(
+                    method, url, headers, post_data, max_network_retries, **kwargs
+                )
+            except Exception:
+                record_upstream('stripe', operation, method.upper(), time.perf_counter() - start, failed=True)
+                raise
+            record_upstream('stripe', operation, method.upper(), time.perf_counter() - start, status >= 500)
+            return content, status, response_headers
+
+    return InstrumentedStripeClient
+
+def configure_stripe(module):
+    """
+    Set the API key and base URL and install the instrumented HTTP client
+    """
+    module.api_key = os.getenv('STRIPE_SECRET_KEY')
+    # Point at a local Stripe stand-in, e.g. for the load tests in bench/
+    module.api_base = os.getenv('STRIPE_API_BASE', module.api_base)
+    module.default_http_client = _instrumented_client_class(module)()
+
+# The Stripe SDK takes around a second to import, most of a cold start, so
+# it is imported and configured the first time a route touches it
+stripe = LazyModule('stripe', on_load=configure_stripe)
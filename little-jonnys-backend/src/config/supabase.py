@@ -1,6 +1,14 @@
 import os
-from supabase import create_client, Client
+import time
+import threading
+import httpx
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
+from src.services.metrics import InstrumentedTransport
+from src.services.circuit_breaker import CircuitBreakerTransport
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 load_dotenv()
 
@@ -8,27 +16,175 @@ load_dotenv()
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 
-def get_supabase_client() -> Client:
+# Connection pool configuration for PostgREST calls
+SUPABASE_POOL_SIZE = int(os.getenv('SUPABASE_POOL_SIZE', '10'))
+SUPABASE_KEEPALIVE_SECONDS = float(os.getenv('SUPABASE_KEEPALIVE_SECONDS', '120'))
+SUPABASE_TIMEOUT = float(os.getenv('SUPABASE_TIMEOUT', '10'))
+SUPABASE_RETRY_SECONDS = 30
+
+def _create_http_client() -> httpx.Client:
+    """
+    Create the pooled keep-alive HTTP/2 client shared by every PostgREST call
+    """
+    transport = httpx.HTTPTransport(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=SUPABASE_POOL_SIZE,
+            max_keepalive_connections=SUPABASE_POOL_SIZE,
+            keepalive_expiry=SUPABASE_KEEPALIVE_SECONDS
+        )
+    )
+    # Calls refused by an open breaker never reach the pool or the metrics
+    return httpx.Client(
+        transport=CircuitBreakerTransport(InstrumentedTransport(transport)),
+        timeout=SUPABASE_TIMEOUT
+    )
+
+def get_supabase_client(http_client: httpx.Client = None) -> 'Client':
     """
     Create and return a Supabase client instance
     """
+    # supabase pulls in the auth, storage and realtime clients too, so it is
+    # imported here rather than on every cold start
+    from supabase import create_client, ClientOptions
+
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
-    
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
 
-# Global client instance
-supabase: Client = None
+    options = ClientOptions(httpx_client=http_client) if http_client else None
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=options)
+
+class SupabaseManager:
+    """
+    Owns the Supabase client for this worker process. The client is created
+    once per process (and again after a fork) and shares one connection pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._http_client = None
+        self._pid = None
+        self._failed_at = None
+        self._requests = 0
+        self._warmed_up = False
+
+    def _count_request(self, request):
+        self._requests += 1
+
+    def _reset(self):
+        # Connections inherited from a parent process can't be shared safely
+        self._client = None
+        self._http_client = None
+        self._failed_at = None
+        self._requests = 0
+        self._warmed_up = False
+        self._pid = os.getpid()
+
+    def get(self):
+        """
+        Return the live client, or None when Supabase isn't configured or
+        can't be reached (routes then use their development fallback)
+        """
+        if self._pid == os.getpid() and self._client is not None:
+            return self._client
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+
+            if self._client is not None:
+                return self._client
+
+            if not SUPABASE_URL or not SUPABASE_KEY:
+                return None
 
-def init_supabase():
+            if self._failed_at and time.monotonic() - self._failed_at < SUPABASE_RETRY_SECONDS:
+                return None
+
+            try:
+                http_client = _create_http_client()
+                http_client.event_hooks['request'].append(self._count_request)
+                self._client = get_supabase_client(http_client)
+                self._http_client = http_client
+                self._failed_at = None
+            except Exception as e:
+                print(f"Failed to initialize Supabase: {e}")
+                self._failed_at = time.monotonic()
+
+            return self._client
+
+    def warm_up(self):
+        """
+        Open a pooled connection (DNS, TLS and HTTP/2 setup) before the first request
+        """
+        client = self.get()
+        if client is None:
+            return False
+
+        try:
+            client.table('prices').select('id').limit(1).execute()
+            self._warmed_up = True
+            return True
+        except Exception as e:
+            print(f"Supabase warm-up failed: {e}")
+            return False
+
+    def stats(self):
+        """
+        Connection pool statistics for the health check
+        """
+        stats = {
+            'configured': bool(SUPABASE_URL and SUPABASE_KEY),
+            'connected': self._client is not None and self._pid == os.getpid(),
+            'warmed_up': self._warmed_up,
+            'requests': self._requests,
+            'pool_size': SUPABASE_POOL_SIZE
+        }
+
+        # Unwrap the breaker and metrics transports to reach httpcore's connection pool
+        transport = getattr(self._http_client, '_transport', None)
+        while transport is not None and not hasattr(transport, '_pool'):
+            transport = getattr(transport, '_transport', None)
+        pool = getattr(transport, '_pool', None)
+        if pool is not None:
+            connections = list(pool.connections)
+            stats['connections'] = len(connections)
+            stats['idle_connections'] = sum(1 for c in connections if c.is_idle())
+            stats['http2_connections'] = sum(1 for c in connections if 'HTTP/2' in c.info())
+
+        return stats
+
+supabase_manager = SupabaseManager()
+
+def get_supabase():
+    """
+    Accessor used by the routes to reach the live client
+    """
+    return supabase_manager.get()
+
+def require_supabase():
     """
-    Initialize the global Supabase client
+    The live client, or None when Supabase isn't configured at all. Raises
+    if it is configured but unavailable (e.g. waiting out a failed init),
+    so background work is retried instead of being dropped.
     """
-    global supabase
-    try:
-        supabase = get_supabase_client()
-        return True
-    except Exception as e:
-        print(f"Failed to initialize Supabase: {e}")
+    client = supabase_manager.get()
+    if client is None and SUPABASE_URL and SUPABASE_KEY:
+        raise RuntimeError('Supabase is configured but not available')
+    return client
+
+def init_supabase(background=False):
+    """
+    Initialize the Supabase client for this process and warm its connection
+    pool, on a background thread if asked so startup doesn't wait for it
+    """
+    if background:
+        threading.Thread(target=init_supabase, name='supabase-warm-up', daemon=True).start()
+        return None
+
+    if supabase_manager.get() is None:
         return False
 
+    supabase_manager.warm_up()
+    return True
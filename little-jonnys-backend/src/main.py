@@ -8,45 +8,125 @@ load_dotenv()
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask
 from flask_cors import CORS
 from src.routes.bookings import bookings_bp
 from src.routes.prices import prices_bp
 from src.routes.allergens import allergens_bp
 from src.routes.payments import payments_bp
+from src.routes.availability import availability_bp
+from src.routes.stats import stats_bp
+from src.config.supabase import init_supabase, supabase_manager
+from src.config.stripe_client import stripe
+from src.services.circuit_breaker import breaker_stats
+from src.services.webhook_queue import queue_stats, start_webhook_workers
+from src.services.booking_outbox import outbox_stats, start_outbox_flusher
+from src.services.booking_index import start_booking_indexes
+from src.services.booking_stream import booking_stream, start_booking_stream
+from src.services.catalog_replica import replica_stats, start_catalog_replica
+from src.services.stripe_reconcile import reconcile_stats, start_reconciliation
+from src.services.refund_jobs import start_refund_jobs
+from src.services.static_files import StaticIndex
+from src.services.image_variants import image_response, is_resizable
+from src.services import compression, metrics
+from src.services.json_provider import FastJSONProvider
 
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
-
-# Enable CORS for all routes
-CORS(app)
-
-# Register API blueprints
-app.register_blueprint(bookings_bp, url_prefix='/api')
-app.register_blueprint(prices_bp, url_prefix='/api')
-app.register_blueprint(allergens_bp, url_prefix='/api')
-app.register_blueprint(payments_bp, url_prefix='/api')
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-        return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
+def create_app():
+    """
+    Build the Flask app and start this process's background services
+    """
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.json = FastJSONProvider(app)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
+
+    # Enable CORS for all routes
+    CORS(app)
+
+    # Request latency and upstream timing on /metrics
+    metrics.init_app(app)
+
+    # Gzip or brotli for large JSON and text responses
+    compression.init_app(app)
+
+    # Register API blueprints
+    app.register_blueprint(bookings_bp, url_prefix='/api')
+    app.register_blueprint(prices_bp, url_prefix='/api')
+    app.register_blueprint(allergens_bp, url_prefix='/api')
+    app.register_blueprint(payments_bp, url_prefix='/api')
+    app.register_blueprint(availability_bp, url_prefix='/api')
+    app.register_blueprint(stats_bp, url_prefix='/api')
+
+    # Create the Supabase client and warm its connection pool, and import the
+    # Stripe SDK, in the background so the worker can take requests sooner
+    init_supabase(background=True)
+    if os.getenv('PRELOAD_IMPORTS', '1') == '1':
+        stripe.preload()
+
+    # Keep the local copy of prices and allergens in step with Supabase
+    start_catalog_replica()
+
+    # Apply queued Stripe webhook events in the background
+    start_webhook_workers()
+
+    # Find paid Checkout sessions whose webhook never reached us
+    start_reconciliation()
+
+    # Finish batch refunds left running by a worker that died
+    start_refund_jobs()
+
+    # Copy bookings from the local outbox to Supabase in the background
+    start_outbox_flusher()
+
+    # Build the availability calendar, admin search index and dashboard
+    # totals from one scan of the bookings, and rebuild them now and then
+    # to pick up other workers' bookings
+    start_booking_indexes()
+
+    # Push booking changes to open admin dashboards
+    start_booking_stream()
+
+    # Index the built frontend once; requests are then served from memory
+    static_index = StaticIndex(app.static_folder)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        static_folder_path = app.static_folder
+        if static_folder_path is None:
+            return "Static folder not configured", 404
+
+        static_file = static_index.get(path) if path != "" else None
+        if static_file is not None:
+            if is_resizable(static_file):
+                return image_response(static_file)
+            return static_index.response(static_file)
         else:
-            return "index.html not found", 404
+            index_file = static_index.get('index.html')
+            if index_file is not None:
+                return static_index.response(index_file)
+            else:
+                return "index.html not found", 404
+
+    @app.route('/health')
+    def health_check():
+        return {
+            'status': 'healthy',
+            'service': 'Little Jonnys Catering API',
+            'supabase': supabase_manager.stats(),
+            'circuit_breakers': breaker_stats(),
+            'catalog_replica': replica_stats(),
+            'webhook_queue': queue_stats(),
+            'booking_outbox': outbox_stats(),
+            'stripe_reconcile': reconcile_stats(),
+            'booking_stream': booking_stream.stats()
+        }
+
+    return app
 
-@app.route('/health')
-def health_check():
-    return {'status': 'healthy', 'service': 'Little Jonnys Catering API'}
+# Production: gunicorn -c gunicorn.conf.py (see DEPLOYMENT_GUIDE.md)
+app = create_app()
 
 if __name__ == '__main__':
+    # Development server only
     app.run(host='0.0.0.0', port=5000, debug=True)
 
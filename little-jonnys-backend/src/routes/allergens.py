@@ -1,118 +1,30 @@
 from flask import Blueprint, request, jsonify
-from src.config.supabase import supabase
+from src.services.catalog_cache import catalog_cache, catalog_response
+from src.services.catalog_replica import replica_rows
+from src.services.allergen_index import FLAG_BITS, allergen_index, parse_exclude
 
 allergens_bp = Blueprint('allergens', __name__)
 
+def _load_allergens():
+    """
+    All allergen information, from the local catalog replica
+    """
+    return replica_rows('allergens')
+
+def _load_allergens_by_service(service_type):
+    """
+    Allergen information for one service type, from the local catalog replica
+    """
+    return replica_rows('allergens', service_type=service_type)
+
 @allergens_bp.route('/allergens', methods=['GET'])
 def get_allergens():
     """
     Get all allergen information
     """
     try:
-        if supabase:
-            result = supabase.table('allergens').select('*').order('service_type').execute()
-            return jsonify({'allergens': result.data}), 200
-        else:
-            # Fallback data for development
-            fallback_allergens = [
-                {
-                    'id': '1',
-                    'service_type': 'hog_roast',
-                    'item_name': 'Roasted Pork',
-                    'contains_gluten': False,
-                    'contains_dairy': False,
-                    'contains_eggs': False,
-                    'contains_nuts': False,
-                    'contains_peanuts': False,
-                    'contains_soy': False,
-                    'contains_fish': False,
-                    'contains_shellfish': False,
-                    'contains_sesame': False,
-                    'vegetarian': False,
-                    'vegan': False
-                },
-                {
-                    'id': '2',
-                    'service_type': 'hog_roast',
-                    'item_name': 'Bread Rolls',
-                    'contains_gluten': True,
-                    'contains_dairy': False,
-                    'contains_eggs': False,
-                    'contains_nuts': False,
-                    'contains_peanuts': False,
-                    'contains_soy': False,
-                    'contains_fish': False,
-                    'contains_shellfish': False,
-                    'contains_sesame': False,
-                    'vegetarian': True,
-                    'vegan': False
-                },
-                {
-                    'id': '3',
-                    'service_type': 'hog_roast',
-                    'item_name': 'Apple Sauce',
-                    'contains_gluten': False,
-                    'contains_dairy': False,
-                    'contains_eggs': False,
-                    'contains_nuts': False,
-                    'contains_peanuts': False,
-                    'contains_soy': False,
-                    'contains_fish': False,
-                    'contains_shellfish': False,
-                    'contains_sesame': False,
-                    'vegetarian': True,
-                    'vegan': True
-                },
-                {
-                    'id': '4',
-                    'service_type': 'pizza',
-                    'item_name': 'Pizza Base',
-                    'contains_gluten': True,
-                    'contains_dairy': False,
-                    'contains_eggs': False,
-                    'contains_nuts': False,
-                    'contains_peanuts': False,
-                    'contains_soy': False,
-                    'contains_fish': False,
-                    'contains_shellfish': False,
-                    'contains_sesame': False,
-                    'vegetarian': True,
-                    'vegan': False
-                },
-                {
-                    'id': '5',
-                    'service_type': 'pizza',
-                    'item_name': 'Mozzarella Cheese',
-                    'contains_gluten': False,
-                    'contains_dairy': True,
-                    'contains_eggs': False,
-                    'contains_nuts': False,
-                    'contains_peanuts': False,
-                    'contains_soy': False,
-                    'contains_fish': False,
-                    'contains_shellfish': False,
-                    'contains_sesame': False,
-                    'vegetarian': True,
-                    'vegan': False
-                },
-                {
-                    'id': '6',
-                    'service_type': 'buffet',
-                    'item_name': 'Mixed Sandwiches',
-                    'contains_gluten': True,
-                    'contains_dairy': True,
-                    'contains_eggs': False,
-                    'contains_nuts': False,
-                    'contains_peanuts': False,
-                    'contains_soy': False,
-                    'contains_fish': False,
-                    'contains_shellfish': False,
-                    'contains_sesame': False,
-                    'vegetarian': True,
-                    'vegan': False
-                }
-            ]
-            return jsonify({'allergens': fallback_allergens}), 200
+        snapshot = catalog_cache.get('allergens', 'all', _load_allergens)
+        return catalog_response(snapshot, 'allergens', lambda allergens: {'allergens': allergens})
             
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
@@ -123,21 +35,8 @@ def get_allergens_by_service(service_type):
     Get allergen information for a specific service type
     """
     try:
-        if supabase:
-            result = supabase.table('allergens').select('*').eq('service_type', service_type).execute()
-            return jsonify({'allergens': result.data}), 200
-        else:
-            # Filter fallback data by service type
-            all_allergens = [
-                {'id': '1', 'service_type': 'hog_roast', 'item_name': 'Roasted Pork', 'contains_gluten': False, 'contains_dairy': False, 'vegetarian': False, 'vegan': False},
-                {'id': '2', 'service_type': 'hog_roast', 'item_name': 'Bread Rolls', 'contains_gluten': True, 'contains_dairy': False, 'vegetarian': True, 'vegan': False},
-                {'id': '3', 'service_type': 'hog_roast', 'item_name': 'Apple Sauce', 'contains_gluten': False, 'contains_dairy': False, 'vegetarian': True, 'vegan': True},
-                {'id': '4', 'service_type': 'pizza', 'item_name': 'Pizza Base', 'contains_gluten': True, 'contains_dairy': False, 'vegetarian': True, 'vegan': False},
-                {'id': '5', 'service_type': 'pizza', 'item_name': 'Mozzarella Cheese', 'contains_gluten': False, 'contains_dairy': True, 'vegetarian': True, 'vegan': False},
-                {'id': '6', 'service_type': 'buffet', 'item_name': 'Mixed Sandwiches', 'contains_gluten': True, 'contains_dairy': True, 'vegetarian': True, 'vegan': False}
-            ]
-            filtered_allergens = [a for a in all_allergens if a['service_type'] == service_type]
-            return jsonify({'allergens': filtered_allergens}), 200
+        snapshot = catalog_cache.get('allergens', f'service:{service_type}', lambda: _load_allergens_by_service(service_type))
+        return catalog_response(snapshot, 'allergens', lambda allergens: {'allergens': allergens})
             
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
@@ -148,28 +47,47 @@ def get_allergen_matrix():
     Get a comprehensive allergen matrix for all services
     """
     try:
-        if supabase:
-            result = supabase.table('allergens').select('*').execute()
-            allergens = result.data
-        else:
-            # Use fallback data
-            allergens = [
-                {'service_type': 'hog_roast', 'item_name': 'Roasted Pork', 'contains_gluten': False, 'contains_dairy': False, 'vegetarian': False, 'vegan': False},
-                {'service_type': 'hog_roast', 'item_name': 'Bread Rolls', 'contains_gluten': True, 'contains_dairy': False, 'vegetarian': True, 'vegan': False},
-                {'service_type': 'pizza', 'item_name': 'Pizza Base', 'contains_gluten': True, 'contains_dairy': False, 'vegetarian': True, 'vegan': False},
-                {'service_type': 'pizza', 'item_name': 'Mozzarella Cheese', 'contains_gluten': False, 'contains_dairy': True, 'vegetarian': True, 'vegan': False},
-                {'service_type': 'buffet', 'item_name': 'Mixed Sandwiches', 'contains_gluten': True, 'contains_dairy': True, 'vegetarian': True, 'vegan': False}
-            ]
+        # Built from the same snapshot as /allergens and the search index
+        snapshot = catalog_cache.get('allergens', 'all', _load_allergens)
+        index = allergen_index(snapshot)
+        return catalog_response(snapshot, 'matrix', lambda allergens: {'allergen_matrix': index.matrix()})
+        
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@allergens_bp.route('/allergens/search', methods=['GET'])
+def search_allergens():
+    """
+    Filter allergen information by dietary need, e.g.
+    /allergens/search?exclude=gluten,dairy&vegan=true&service=pizza
+    """
+    try:
+        exclude_mask = parse_exclude(request.args.get('exclude'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    require_mask = 0
+    for flag in ('vegetarian', 'vegan'):
+        if request.args.get(flag, '').lower() in ('true', '1', 'yes'):
+            require_mask |= FLAG_BITS[flag]
+    
+    services = tuple(sorted(s.strip() for s in request.args.get('service', '').split(',') if s.strip()))
+    
+    try:
+        snapshot = catalog_cache.get('allergens', 'all', _load_allergens)
+        index = allergen_index(snapshot)
+        
+        # Responses are kept with the snapshot per query, so only service
+        # types the catalog has may go into the key
+        known = tuple(s for s in services if s in index.groups)
+        if services and not known:
+            return jsonify({'allergens': [], 'count': 0}), 200
         
-        # Group by service type
-        matrix = {}
-        for allergen in allergens:
-            service = allergen['service_type']
-            if service not in matrix:
-                matrix[service] = []
-            matrix[service].append(allergen)
+        def build(allergens):
+            results = index.search(exclude_mask, require_mask, known)
+            return {'allergens': results, 'count': len(results)}
         
-        return jsonify({'allergen_matrix': matrix}), 200
+        return catalog_response(snapshot, ('search', exclude_mask, require_mask, known), build)
         
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
@@ -0,0 +1,46 @@
+from flask import Blueprint, request, jsonify
+from datetime import date, timedelta
+from src.services.availability import (
+    DEFAULT_RANGE_DAYS, MAX_RANGE_DAYS, SERVICE_CAPACITY, availability_index
+)
+
+availability_bp = Blueprint('availability', __name__)
+
+@availability_bp.route('/availability', methods=['GET'])
+def get_availability():
+    """
+    Remaining capacity per service for each day in a range, e.g.
+    /availability?from=2025-06-01&to=2025-06-30&service=hog_roast,bar
+    
+    from defaults to today and to to 90 days later; service defaults to
+    every service with a capacity.
+    """
+    try:
+        start = date.fromisoformat(request.args['from']) if request.args.get('from') else date.today()
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') else start + timedelta(days=DEFAULT_RANGE_DAYS)
+    except ValueError:
+        return jsonify({'error': 'from and to must be dates in YYYY-MM-DD format'}), 400
+    
+    if end < start:
+        return jsonify({'error': 'to must not be before from'}), 400
+    if (end - start).days >= MAX_RANGE_DAYS:
+        return jsonify({'error': f'Date range is limited to {MAX_RANGE_DAYS} days'}), 400
+    
+    services = [s.strip() for s in request.args.get('service', '').split(',') if s.strip()] or list(SERVICE_CAPACITY)
+    for service in services:
+        if service not in SERVICE_CAPACITY:
+            return jsonify({'error': f'Unknown service: {service}'}), 400
+    
+    if not availability_index.loaded:
+        return jsonify({'error': 'Availability is still loading'}), 503, {'Retry-After': '1'}
+    
+    try:
+        return jsonify({
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'capacity': {service: SERVICE_CAPACITY[service] for service in services},
+            'days': availability_index.calendar(start, end, services)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
@@ -1,10 +1,28 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from datetime import datetime
-import uuid
-from src.config.supabase import supabase
+import csv
+import io
+from src.config.supabase import get_supabase
+from src.services.metrics import record_fallback
+from src.services.booking_events import publish
+from src.services.booking_outbox import (
+    add_booking, get_unsent_booking, pending_booking_changes, queue_booking_update, update_unsent_booking
+)
+from src.services.circuit_breaker import CircuitOpenError, upstream_available
+from src.services.singleflight import SingleFlight
+from src.services.booking_search import DEFAULT_RESULTS, MAX_RESULTS, booking_search_index
+from src.services.booking_stream import StreamFull, booking_stream, stream_events
+from src.services.booking_pages import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, fetch_page, iter_bookings, parse_fields
+)
 
 bookings_bp = Blueprint('bookings', __name__)
 
+# Concurrent reads of the same booking share one Supabase request
+booking_reads = SingleFlight('booking', timeout=5)
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
 @bookings_bp.route('/bookings', methods=['POST'])
 def create_booking():
     """
@@ -51,24 +69,22 @@ def create_booking():
             'status': 'pending'
         }
         
-        # Insert into Supabase
-        if supabase:
-            result = supabase.table('bookings').insert(booking_data).execute()
-            
-            if result.data:
-                return jsonify({
-                    'success': True,
-                    'message': 'Booking request submitted successfully',
-                    'booking_id': result.data[0]['id']
-                }), 201
-            else:
-                return jsonify({'error': 'Failed to create booking'}), 500
+        # Save locally; the outbox flusher copies it to Supabase in the background
+        booking_id, booking = add_booking(booking_data)
+        publish('created', booking)
+        
+        if get_supabase():
+            return jsonify({
+                'success': True,
+                'message': 'Booking request submitted successfully',
+                'booking_id': booking_id
+            }), 201
         else:
-            # Fallback for development without Supabase
+            # Development without Supabase: the booking stays in the local outbox
             return jsonify({
                 'success': True,
                 'message': 'Booking request received (development mode)',
-                'booking_id': str(uuid.uuid4())
+                'booking_id': booking_id
             }), 201
             
     except Exception as e:
@@ -77,34 +93,183 @@ def create_booking():
 @bookings_bp.route('/bookings', methods=['GET'])
 def get_bookings():
     """
-    Get all bookings (admin only)
+    Get bookings, newest first (admin only)
+    
+    Query parameters:
+        limit  - page size (default 50, maximum 500)
+        cursor - next_cursor from the previous page
+        fields - comma separated columns to return, e.g. fields=id,client_name,event_date
+        format - ndjson or csv to stream every matching booking instead of one page
     """
     try:
+        columns = parse_fields(request.args.get('fields'))
+        export_format = request.args.get('format')
+        
+        if export_format and export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'Unsupported format: {export_format}'}), 400
+        
+        try:
+            limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return jsonify({'error': 'limit must be a number'}), 400
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        
+        cursor = request.args.get('cursor')
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        supabase = get_supabase()
+        
+        if export_format:
+            rows = iter_bookings(supabase, columns) if supabase else iter([])
+            return _export_response(rows, export_format)
+        
         if supabase:
-            result = supabase.table('bookings').select('*').order('created_at', desc=True).execute()
-            return jsonify({'bookings': result.data}), 200
+            bookings, next_cursor = fetch_page(supabase, columns, limit, cursor)
+            return jsonify({'bookings': bookings, 'next_cursor': next_cursor}), 200
         else:
-            return jsonify({'bookings': []}), 200
+            record_fallback('bookings')
+            return jsonify({'bookings': [], 'next_cursor': None}), 200
             
+    except CircuitOpenError as e:
+        return _unavailable(e)
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@bookings_bp.route('/bookings/search', methods=['GET'])
+def search_bookings():
+    """
+    Find bookings by customer name, email, phone or location (admin only)
+    
+    Query parameters:
+        q      - words to search for; each is matched as a prefix
+        limit  - results per page (default 20, maximum 100)
+        offset - number of results to skip
+    """
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'Missing search query'}), 400
+    
+    try:
+        limit = max(1, min(int(request.args.get('limit', DEFAULT_RESULTS)), MAX_RESULTS))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be numbers'}), 400
+    
+    if not booking_search_index.loaded:
+        return jsonify({'error': 'Search index is still loading'}), 503, {'Retry-After': '1'}
+    
+    try:
+        results, total = booking_search_index.search(q, limit, offset)
+        next_offset = offset + limit if offset + limit < total else None
+        return jsonify({'bookings': results, 'total': total, 'next_offset': next_offset}), 200
+        
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+@bookings_bp.route('/bookings/stream', methods=['GET'])
+def stream_bookings():
+    """
+    Server-Sent Events feed of booking changes for the admin dashboard
+    (admin only). Events: created, updated, paid, payment_failed, refunded,
+    plus reset when the client has missed too much and should reload the
+    list. Reconnects resume after the Last-Event-ID header.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID must be a number'}), 400
+    
+    try:
+        booking_stream.connect()
+    except StreamFull as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '30'}
+    
+    response = Response(
+        stream_with_context(stream_events(last_id)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # Stop nginx from buffering the stream
+            'X-Accel-Buffering': 'no'
+        }
+    )
+    response.call_on_close(booking_stream.disconnect)
+    return response
+
+def _unavailable(error):
+    """
+    Answer straight away while Supabase's breaker is open
+    """
+    return jsonify({'error': str(error)}), 503, {'Retry-After': str(int(error.retry_after))}
+
+def _export_response(rows, export_format):
+    """
+    Stream bookings as NDJSON or CSV, writing each page as it is fetched
+    """
+    if export_format == 'ndjson':
+        def generate():
+            for row in rows:
+                yield current_app.json.dumps_bytes(row) + b'\n'
+        
+        mimetype = 'application/x-ndjson'
+    else:
+        def generate():
+            buffer = io.StringIO()
+            writer = None
+            for row in rows:
+                if writer is None:
+                    writer = csv.DictWriter(buffer, fieldnames=list(row.keys()), extrasaction='ignore')
+                    writer.writeheader()
+                writer.writerow(row)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        
+        mimetype = 'text/csv'
+    
+    filename = f'bookings.{export_format}'
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 @bookings_bp.route('/bookings/<booking_id>', methods=['GET'])
 def get_booking(booking_id):
     """
     Get a specific booking by ID
     """
     try:
+        # Bookings still waiting in the outbox aren't in Supabase yet
+        unsent = get_unsent_booking(booking_id)
+        if unsent:
+            return jsonify({'booking': unsent}), 200
+        
+        supabase = get_supabase()
         if supabase:
-            result = supabase.table('bookings').select('*').eq('id', booking_id).execute()
+            rows = booking_reads.do(
+                booking_id, lambda: supabase.table('bookings').select('*').eq('id', booking_id).execute().data
+            )
             
-            if result.data:
-                return jsonify({'booking': result.data[0]}), 200
+            if rows:
+                booking = rows[0]
+                # Edits queued while Supabase was unavailable
+                changes = pending_booking_changes(booking_id)
+                if changes:
+                    booking = dict(booking, **changes)
+                return jsonify({'booking': booking}), 200
             else:
                 return jsonify({'error': 'Booking not found'}), 404
         else:
             return jsonify({'error': 'Database not available'}), 503
             
+    except CircuitOpenError as e:
+        return _unavailable(e)
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
@@ -116,10 +281,27 @@ def update_booking(booking_id):
     try:
         data = request.get_json()
         
+        unsent = update_unsent_booking(booking_id, data)
+        if unsent:
+            publish('updated', unsent)
+            return jsonify({
+                'success': True,
+                'message': 'Booking updated successfully',
+                'booking': unsent
+            }), 200
+        
+        supabase = get_supabase()
+        if supabase and not upstream_available('bookings'):
+            return _queue_update(booking_id, data)
+        
         if supabase:
-            result = supabase.table('bookings').update(data).eq('id', booking_id).execute()
+            try:
+                result = supabase.table('bookings').update(data).eq('id', booking_id).execute()
+            except CircuitOpenError:
+                return _queue_update(booking_id, data)
             
             if result.data:
+                publish('updated', result.data[0])
                 return jsonify({
                     'success': True,
                     'message': 'Booking updated successfully',
@@ -133,3 +315,14 @@ def update_booking(booking_id):
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+def _queue_update(booking_id, data):
+    """
+    Keep an edit locally until Supabase is reachable again
+    """
+    queue_booking_update(booking_id, data)
+    publish('updated', dict(data, id=booking_id))
+    return jsonify({
+        'success': True,
+        'message': 'Booking update queued; it will be saved when the database is available',
+        'queued': True
+    }), 202
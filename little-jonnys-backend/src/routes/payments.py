@@ -1,12 +1,56 @@
 from flask import Blueprint, request, jsonify, url_for
-import stripe
 import os
-from src.config.supabase import supabase
+import time
+from src.config.supabase import get_supabase, require_supabase
+from src.config.stripe_client import stripe
+from src.services.webhook_queue import enqueue_event, webhook_handler
+from src.services.checkout_sessions import find_open_session, idempotency_key, mark_session, record_session
+from src.services.booking_events import publish
+from src.services.booking_outbox import queue_booking_update
+from src.services.circuit_breaker import upstream_available
+from src.services.payment_state import record_payment, wait_for_payment
+from src.services.refund_jobs import MAX_BATCH_REFUNDS, RefundBatchConflict, get_refund_job, start_refund_job
+from src.services.singleflight import SingleFlight
 
 payments_bp = Blueprint('payments', __name__)
 
-# Configure Stripe
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+# Clicks in this process for the same booking and amount wait for one
+# Stripe call; clicks that reach another worker meet at the idempotency key
+checkout_flights = SingleFlight('checkout', timeout=30)
+IDEMPOTENCY_RETRIES = 4
+
+
+def _key_in_use(error):
+    # Stripe answers 409 while another request holds the key, and raises
+    # IdempotencyError when the key was used with different parameters
+    return isinstance(error, stripe.error.IdempotencyError) or error.http_status == 409
+
+
+def _checkout_session(booking_id, amount_pence, session_params):
+    """
+    The booking's open session for this amount, creating one if needed
+    """
+    for attempt in range(IDEMPOTENCY_RETRIES + 1):
+        # Hand back the session from an earlier click if it's still usable
+        existing = find_open_session(booking_id, amount_pence)
+        if existing:
+            return {'checkout_url': existing['url'], 'session_id': existing['session_id']}
+
+        # If the shared key is still refused after every retry (e.g. a worker
+        # died mid-request), the last attempt makes a session under a new key
+        key = idempotency_key(booking_id, amount_pence, session_params, fresh=attempt == IDEMPOTENCY_RETRIES)
+        try:
+            session = stripe.checkout.Session.create(**session_params, idempotency_key=key)
+        except stripe.error.StripeError as e:
+            # Another worker is creating the session with this key right now;
+            # once it is done, the retry finds or replays that session
+            if not _key_in_use(e) or attempt == IDEMPOTENCY_RETRIES:
+                raise
+            time.sleep(0.25 * (attempt + 1))
+            continue
+
+        record_session(booking_id, amount_pence, session)
+        return {'checkout_url': session.url, 'session_id': session.id}
 
 @payments_bp.route('/create-checkout-session', methods=['POST'])
 def create_checkout_session():
@@ -30,8 +74,8 @@ def create_checkout_session():
         # Convert amount to pence (Stripe uses smallest currency unit)
         amount_pence = int(amount * 100)
         
-        # Create Stripe Checkout session
-        session = stripe.checkout.Session.create(
+        # Reuse the booking's open session or create a Stripe Checkout session
+        session_params = dict(
             payment_method_types=['card'],
             line_items=[{
                 'price_data': {
@@ -51,16 +95,25 @@ def create_checkout_session():
                 'customer_name': customer_name,
                 'payment_type': 'deposit'
             },
+            payment_intent_data={
+                'metadata': {
+                    'booking_id': booking_id,
+                    'payment_type': 'deposit'
+                }
+            },
             success_url=request.host_url + f'payment-success?session_id={{CHECKOUT_SESSION_ID}}&booking_id={booking_id}',
             cancel_url=request.host_url + f'payment-cancelled?booking_id={booking_id}',
         )
+        result = checkout_flights.do(
+            (str(booking_id), amount_pence),
+            lambda: _checkout_session(booking_id, amount_pence, session_params)
+        )
         
-        return jsonify({
-            'checkout_url': session.url,
-            'session_id': session.id
-        }), 200
+        return jsonify(result), 200
         
     except stripe.error.StripeError as e:
+        if _key_in_use(e):
+            return jsonify({'error': 'A checkout for this booking is already being created, please try again'}), 409
         return jsonify({'error': f'Stripe error: {str(e)}'}), 400
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
@@ -77,11 +130,28 @@ def payment_success():
         return jsonify({'error': 'Missing session_id or booking_id'}), 400
     
     try:
-        # Retrieve the session from Stripe
+        # The webhook usually lands before the customer is redirected back;
+        # the booking update is then left to the webhook worker
+        state = wait_for_payment(session_id)
+        if state:
+            if state['booking_id'] != booking_id:
+                return jsonify({'error': 'Payment does not match booking'}), 400
+            return jsonify({
+                'success': True,
+                'message': 'Payment successful! Your booking deposit has been received.',
+                'booking_id': booking_id,
+                'amount_paid': state['amount_total'] / 100
+            }), 200
+        
+        # No webhook yet, retrieve the session from Stripe
         session = stripe.checkout.Session.retrieve(session_id)
+        record_payment(session)
         
         if session.payment_status == 'paid':
+            mark_session(session_id, 'complete')
+            
             # Update booking in Supabase
+            supabase = get_supabase()
             if supabase:
                 update_data = {
                     'deposit_paid': True,
@@ -90,9 +160,21 @@ def payment_success():
                     'stripe_session_id': session_id
                 }
                 
-                result = supabase.table('bookings').update(update_data).eq('id', booking_id).execute()
+                if upstream_available('bookings'):
+                    result = supabase.table('bookings').update(update_data).eq('id', booking_id).execute()
+                else:
+                    # Supabase is down; record the payment once it is back
+                    queue_booking_update(booking_id, update_data)
+                    publish('paid', dict(update_data, id=booking_id))
+                    return jsonify({
+                        'success': True,
+                        'message': 'Payment successful! Your booking deposit has been received.',
+                        'booking_id': booking_id,
+                        'amount_paid': session.amount_total / 100
+                    }), 200
                 
                 if result.data:
+                    publish('paid', result.data[0])
                     return jsonify({
                         'success': True,
                         'message': 'Payment successful! Your booking deposit has been received.',
@@ -146,30 +228,59 @@ def stripe_webhook():
     except stripe.error.SignatureVerificationError as e:
         return jsonify({'error': 'Invalid signature'}), 400
     
-    # Handle the event
+    # Let the success redirect see the outcome without waiting for the worker
     if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        booking_id = session['metadata'].get('booking_id')
-        
-        if booking_id and supabase:
-            # Update booking status
-            update_data = {
-                'deposit_paid': True,
-                'status': 'deposit_paid',
-                'deposit_amount': session['amount_total'] / 100,
-                'stripe_session_id': session['id']
-            }
-            
-            supabase.table('bookings').update(update_data).eq('id', booking_id).execute()
+        record_payment(event['data']['object'])
     
-    elif event['type'] == 'payment_intent.payment_failed':
-        # Handle failed payment
-        payment_intent = event['data']['object']
-        # Log the failure or notify admin
-        pass
+    # Store the event and apply it in the background so Stripe gets an
+    # immediate answer; redeliveries of a stored event are ignored
+    enqueue_event(event['id'], event['type'], payload)
     
     return jsonify({'status': 'success'}), 200
 
+@webhook_handler('checkout.session.completed')
+def handle_checkout_completed(session):
+    """
+    Mark the booking's deposit as paid
+    """
+    booking_id = session['metadata'].get('booking_id')
+    mark_session(session['id'], 'complete')
+    
+    supabase = require_supabase()
+    if booking_id and supabase:
+        # Update booking status
+        update_data = {
+            'deposit_paid': True,
+            'status': 'deposit_paid',
+            'deposit_amount': session['amount_total'] / 100,
+            'stripe_session_id': session['id']
+        }
+        
+        supabase.table('bookings').update(update_data).eq('id', booking_id).execute()
+        publish('paid', dict(update_data, id=booking_id))
+
+@webhook_handler('checkout.session.expired')
+def handle_checkout_expired(session):
+    """
+    Stop handing out a session Stripe has closed
+    """
+    mark_session(session['id'], 'expired')
+
+@webhook_handler('payment_intent.payment_failed')
+def handle_payment_failed(payment_intent):
+    """
+    Record a failed deposit payment against its booking
+    """
+    booking_id = (payment_intent.get('metadata') or {}).get('booking_id')
+    error = payment_intent.get('last_payment_error') or {}
+    print(f"Payment failed for booking {booking_id}: {error.get('message', 'unknown error')}")
+    
+    supabase = require_supabase()
+    if booking_id and supabase:
+        # Don't overwrite a deposit that was paid by a later attempt
+        supabase.table('bookings').update({'status': 'payment_failed'}).eq('id', booking_id).neq('status', 'deposit_paid').execute()
+        publish('payment_failed', {'id': booking_id, 'status': 'payment_failed'})
+
 @payments_bp.route('/refund', methods=['POST'])
 def create_refund():
     """
@@ -212,3 +323,74 @@ def create_refund():
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+@payments_bp.route('/refunds/batch', methods=['POST'])
+def create_refund_batch():
+    """
+    Refund many deposits at once, e.g. when an event day is cancelled (admin only).
+    Body: {"refunds": [{"session_id": "cs_...", "amount": 50.00}, ...], "reason": "...",
+           "idempotency_key": "..."}
+    Answers straight away with a job id; poll /refunds/batch/<job_id> for progress.
+    Resubmitting a batch (same idempotency_key, or same refunds if none is given)
+    returns the original job rather than refunding again.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        refunds = data.get('refunds')
+        reason = data.get('reason', 'requested_by_customer')
+        batch_key = data.get('idempotency_key')
+        
+        if not isinstance(refunds, list) or not refunds:
+            return jsonify({'error': 'refunds must be a non-empty list'}), 400
+        
+        if batch_key is not None and (not isinstance(batch_key, str) or not batch_key or len(batch_key) > 255):
+            return jsonify({'error': 'idempotency_key must be a string of up to 255 characters'}), 400
+        
+        if len(refunds) > MAX_BATCH_REFUNDS:
+            return jsonify({'error': f'Too many refunds (maximum {MAX_BATCH_REFUNDS})'}), 400
+        
+        items = []
+        seen = set()
+        for index, refund in enumerate(refunds):
+            if not isinstance(refund, dict) or not isinstance(refund.get('session_id'), str) or not refund['session_id']:
+                return jsonify({'error': f'Refund {index}: missing session_id'}), 400
+            
+            if refund['session_id'] in seen:
+                return jsonify({'error': f'Refund {index}: duplicate session_id'}), 400
+            seen.add(refund['session_id'])
+            
+            amount = refund.get('amount')  # Optional partial refund amount
+            try:
+                amount_pence = int(round(float(amount) * 100)) if amount else None  # Convert to pence
+            except (TypeError, ValueError):
+                return jsonify({'error': f'Refund {index}: invalid amount'}), 400
+            
+            items.append({'session_id': refund['session_id'], 'amount_pence': amount_pence})
+        
+        job_id, created = start_refund_job(items, reason, batch_key)
+        
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'total': len(items),
+            'status_url': url_for('payments.get_refund_batch', job_id=job_id)
+        }), 202 if created else 200
+        
+    except RefundBatchConflict as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@payments_bp.route('/refunds/batch/<job_id>', methods=['GET'])
+def get_refund_batch(job_id):
+    """
+    Progress and per-refund results of a batch refund job (admin only)
+    """
+    try:
+        job = get_refund_job(job_id)
+        if job is None:
+            return jsonify({'error': 'Refund job not found'}), 404
+        
+        return jsonify(job), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
@@ -1,76 +1,35 @@
 from flask import Blueprint, request, jsonify
-from src.config.supabase import supabase
+from src.services.catalog_cache import catalog_cache, catalog_response
+from src.services.catalog_replica import (
+    MANUAL_SYNC_SECONDS, REPLICA_TABLES, claim_sync, record_sync_error, refresh_cached_snapshots, replica_rows,
+    sync_table
+)
+from src.services.quote_engine import QuoteInputError, pricing_plan
 
 prices_bp = Blueprint('prices', __name__)
 
+MAX_BATCH_SCENARIOS = 1000
+
+def _load_prices():
+    """
+    All active prices, from the local catalog replica
+    """
+    return replica_rows('prices', active=True)
+
+def _load_prices_by_service(service_type):
+    """
+    Active prices for one service type, from the local catalog replica
+    """
+    return replica_rows('prices', service_type=service_type, active=True)
+
 @prices_bp.route('/prices', methods=['GET'])
 def get_prices():
     """
     Get all active prices
     """
     try:
-        if supabase:
-            result = supabase.table('prices').select('*').eq('active', True).order('service_type').execute()
-            return jsonify({'prices': result.data}), 200
-        else:
-            # Fallback data for development
-            fallback_prices = [
-                {
-                    'id': '1',
-                    'service_type': 'hog_roast',
-                    'service_name': 'Hog Roast Catering',
-                    'price_per_unit': 8.50,
-                    'unit_type': 'person',
-                    'minimum_quantity': 50,
-                    'description': 'Traditional slow-cooked hog roast with all accompaniments'
-                },
-                {
-                    'id': '2',
-                    'service_type': 'pizza',
-                    'service_name': 'Mobile Pizza Van',
-                    'price_per_unit': 12.00,
-                    'unit_type': 'pizza',
-                    'minimum_quantity': None,
-                    'description': 'Wood-fired pizzas made fresh on-site'
-                },
-                {
-                    'id': '3',
-                    'service_type': 'bar',
-                    'service_name': 'Mobile Bar Service',
-                    'price_per_unit': 300.00,
-                    'unit_type': 'event',
-                    'minimum_quantity': None,
-                    'description': 'Professional licensed mobile bar with bartender'
-                },
-                {
-                    'id': '4',
-                    'service_type': 'buffet',
-                    'service_name': 'Buffet Package 1',
-                    'price_per_unit': 6.50,
-                    'unit_type': 'person',
-                    'minimum_quantity': 20,
-                    'description': 'Basic buffet package'
-                },
-                {
-                    'id': '5',
-                    'service_type': 'buffet',
-                    'service_name': 'Buffet Package 2',
-                    'price_per_unit': 8.50,
-                    'unit_type': 'person',
-                    'minimum_quantity': 20,
-                    'description': 'Standard buffet package'
-                },
-                {
-                    'id': '6',
-                    'service_type': 'buffet',
-                    'service_name': 'Buffet Package 3',
-                    'price_per_unit': 12.50,
-                    'unit_type': 'person',
-                    'minimum_quantity': 20,
-                    'description': 'Premium buffet package'
-                }
-            ]
-            return jsonify({'prices': fallback_prices}), 200
+        snapshot = catalog_cache.get('prices', 'active', _load_prices)
+        return catalog_response(snapshot, 'prices', lambda prices: {'prices': prices})
             
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
@@ -81,25 +40,41 @@ def get_prices_by_service(service_type):
     Get prices for a specific service type
     """
     try:
-        if supabase:
-            result = supabase.table('prices').select('*').eq('service_type', service_type).eq('active', True).execute()
-            return jsonify({'prices': result.data}), 200
-        else:
-            # Filter fallback data by service type
-            all_prices = [
-                {'id': '1', 'service_type': 'hog_roast', 'service_name': 'Hog Roast Catering', 'price_per_unit': 8.50, 'unit_type': 'person', 'minimum_quantity': 50},
-                {'id': '2', 'service_type': 'pizza', 'service_name': 'Mobile Pizza Van', 'price_per_unit': 12.00, 'unit_type': 'pizza', 'minimum_quantity': None},
-                {'id': '3', 'service_type': 'bar', 'service_name': 'Mobile Bar Service', 'price_per_unit': 300.00, 'unit_type': 'event', 'minimum_quantity': None},
-                {'id': '4', 'service_type': 'buffet', 'service_name': 'Buffet Package 1', 'price_per_unit': 6.50, 'unit_type': 'person', 'minimum_quantity': 20},
-                {'id': '5', 'service_type': 'buffet', 'service_name': 'Buffet Package 2', 'price_per_unit': 8.50, 'unit_type': 'person', 'minimum_quantity': 20},
-                {'id': '6', 'service_type': 'buffet', 'service_name': 'Buffet Package 3', 'price_per_unit': 12.50, 'unit_type': 'person', 'minimum_quantity': 20}
-            ]
-            filtered_prices = [p for p in all_prices if p['service_type'] == service_type]
-            return jsonify({'prices': filtered_prices}), 200
+        snapshot = catalog_cache.get('prices', f'service:{service_type}', lambda: _load_prices_by_service(service_type))
+        return catalog_response(snapshot, 'prices', lambda prices: {'prices': prices})
             
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+@prices_bp.route('/catalog/invalidate', methods=['POST'])
+def invalidate_catalog():
+    """
+    Pull prices or allergens into the local replica straight after they
+    change, rather than at the next scheduled sync, and drop cached
+    snapshots if they changed (admin only). Tables synced in the last few
+    seconds are skipped, so repeated calls don't each hit Supabase.
+    """
+    data = request.get_json(silent=True) or {}
+    tables = data.get('tables') if isinstance(data, dict) else None
+    if tables is None:
+        tables = list(REPLICA_TABLES)
+    elif not isinstance(tables, list) or not all(table in REPLICA_TABLES for table in tables):
+        return jsonify({'error': f'tables must be a list of: {", ".join(REPLICA_TABLES)}'}), 400
+    
+    synced = {}
+    for table in tables:
+        if not claim_sync(table, interval=MANUAL_SYNC_SECONDS):
+            synced[table] = 'skipped: synced recently'
+            continue
+        try:
+            synced[table] = 'updated' if sync_table(table) else 'unchanged'
+        except Exception as e:
+            record_sync_error(table, e)
+            synced[table] = f'failed: {str(e)}'
+        refresh_cached_snapshots(table)
+    
+    return jsonify({'success': True, 'invalidated': tables, 'synced': synced}), 200
+
 @prices_bp.route('/quote', methods=['POST'])
 def calculate_quote():
     """
@@ -107,85 +82,38 @@ def calculate_quote():
     """
     try:
         data = request.get_json()
-        services = data.get('services', {})
         
-        total_quote = 0
-        quote_breakdown = []
+        snapshot = catalog_cache.get('prices', 'active', _load_prices)
+        quote = pricing_plan(snapshot).quote(data)
         
-        # Hog Roast
-        if services.get('hogRoast') and data.get('hogRoastGuests'):
-            guests = int(data['hogRoastGuests'])
-            price_per_person = 8.50
-            service_total = guests * price_per_person
-            total_quote += service_total
-            quote_breakdown.append({
-                'service': 'Hog Roast Catering',
-                'quantity': guests,
-                'unit': 'person',
-                'price_per_unit': price_per_person,
-                'total': service_total
-            })
+        return jsonify(quote), 200
         
-        # Pizza Van
-        if services.get('pizza') and data.get('pizzaGuests'):
-            guests = int(data['pizzaGuests'])
-            # Estimate 1.5 pizzas per person
-            pizzas = max(1, int(guests * 1.5))
-            price_per_pizza = 12.00
-            service_total = pizzas * price_per_pizza
-            total_quote += service_total
-            quote_breakdown.append({
-                'service': 'Mobile Pizza Van',
-                'quantity': pizzas,
-                'unit': 'pizza',
-                'price_per_unit': price_per_pizza,
-                'total': service_total,
-                'note': f'Estimated {pizzas} pizzas for {guests} guests'
-            })
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@prices_bp.route('/quote/batch', methods=['POST'])
+def calculate_quote_batch():
+    """
+    Calculate quotes for many scenarios in one call, e.g. a sweep over guest numbers
+    """
+    try:
+        data = request.get_json()
+        scenarios = data.get('scenarios') if isinstance(data, dict) else None
         
-        # Mobile Bar
-        if services.get('bar'):
-            service_total = 300.00
-            total_quote += service_total
-            quote_breakdown.append({
-                'service': 'Mobile Bar Service',
-                'quantity': 1,
-                'unit': 'event',
-                'price_per_unit': service_total,
-                'total': service_total
-            })
+        if not isinstance(scenarios, list) or not all(isinstance(s, dict) for s in scenarios):
+            return jsonify({'error': 'scenarios must be a list of quote requests'}), 400
         
-        # Buffet
-        if services.get('buffet') and data.get('buffetGuests'):
-            guests = int(data['buffetGuests'])
-            package = data.get('buffetPackage', 'package1')
-            
-            price_per_person = {
-                'package1': 6.50,
-                'package2': 8.50,
-                'package3': 12.50
-            }.get(package, 6.50)
-            
-            service_total = guests * price_per_person
-            total_quote += service_total
-            quote_breakdown.append({
-                'service': f'Buffet Catering ({package.replace("package", "Package ")})',
-                'quantity': guests,
-                'unit': 'person',
-                'price_per_unit': price_per_person,
-                'total': service_total
-            })
+        if len(scenarios) > MAX_BATCH_SCENARIOS:
+            return jsonify({'error': f'Too many scenarios (maximum {MAX_BATCH_SCENARIOS})'}), 400
         
-        # Calculate deposit (20% or minimum £500)
-        deposit_amount = max(500, total_quote * 0.2)
+        snapshot = catalog_cache.get('prices', 'active', _load_prices)
         
-        return jsonify({
-            'total_quote': round(total_quote, 2),
-            'deposit_amount': round(deposit_amount, 2),
-            'breakdown': quote_breakdown,
-            'currency': 'GBP'
-        }), 200
+        try:
+            quotes = pricing_plan(snapshot).quote_many(scenarios)
+        except QuoteInputError as e:
+            return jsonify({'error': f'Scenario {e.index}: {str(e)}'}), 400
+        
+        return jsonify({'quotes': quotes, 'count': len(quotes)}), 200
         
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
-
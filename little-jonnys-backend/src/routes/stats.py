@@ -0,0 +1,17 @@
+from flask import Blueprint, jsonify
+from src.services.booking_stats import booking_stats
+
+stats_bp = Blueprint('stats', __name__)
+
+@stats_bp.route('/stats', methods=['GET'])
+def get_stats():
+    """
+    Booking counts by status, deposits taken by month and guests per service (admin only)
+    """
+    if not booking_stats.loaded:
+        return jsonify({'error': 'Stats are still loading'}), 503, {'Retry-After': '1'}
+    
+    try:
+        return jsonify(booking_stats.snapshot()), 200
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
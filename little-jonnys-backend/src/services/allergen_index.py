@@ -0,0 +1,112 @@
+# Bit positions for the allergen flags stored on each allergens row
+ALLERGEN_FLAGS = [
+    'contains_gluten',
+    'contains_dairy',
+    'contains_eggs',
+    'contains_nuts',
+    'contains_peanuts',
+    'contains_soy',
+    'contains_fish',
+    'contains_shellfish',
+    'contains_sesame',
+    'vegetarian',
+    'vegan'
+]
+
+FLAG_BITS = {flag: 1 << position for position, flag in enumerate(ALLERGEN_FLAGS)}
+
+# Short names accepted by ?exclude=, e.g. exclude=gluten,dairy
+ALLERGEN_NAMES = {
+    flag[len('contains_'):]: bit
+    for flag, bit in FLAG_BITS.items()
+    if flag.startswith('contains_')
+}
+
+
+def pack_flags(row):
+    """
+    Pack a row's allergen booleans into a single integer bitmask
+    """
+    mask = 0
+    for flag, bit in FLAG_BITS.items():
+        if row.get(flag):
+            mask |= bit
+    return mask
+
+
+def parse_exclude(value):
+    """
+    Turn a comma separated list of allergen names into a bitmask,
+    raising ValueError for names we don't track
+    """
+    mask = 0
+    for name in (value or '').split(','):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in ALLERGEN_NAMES:
+            raise ValueError(f'Unknown allergen: {name}')
+        mask |= ALLERGEN_NAMES[name]
+    return mask
+
+
+class _ServiceGroup:
+    def __init__(self):
+        self.masks = []
+        self.rows = []
+        # Flags set on any item / on every item, used to accept or reject
+        # the whole group without checking items one by one
+        self.any_mask = 0
+        self.all_mask = (1 << len(ALLERGEN_FLAGS)) - 1
+
+    def add(self, mask, row):
+        self.masks.append(mask)
+        self.rows.append(row)
+        self.any_mask |= mask
+        self.all_mask &= mask
+
+    def search(self, exclude_mask, require_mask):
+        if exclude_mask & self.any_mask == 0 and require_mask & self.all_mask == require_mask:
+            return self.rows
+        return [
+            row for mask, row in zip(self.masks, self.rows)
+            if mask & exclude_mask == 0 and mask & require_mask == require_mask
+        ]
+
+
+class AllergenIndex:
+    """
+    Allergen rows grouped by service type with their flags packed into bitmasks
+    """
+
+    def __init__(self, rows):
+        self.groups = {}
+        for row in rows:
+            service = row['service_type']
+            if service not in self.groups:
+                self.groups[service] = _ServiceGroup()
+            self.groups[service].add(pack_flags(row), row)
+
+    def matrix(self):
+        return {service: group.rows for service, group in self.groups.items()}
+
+    def search(self, exclude_mask=0, require_mask=0, services=None):
+        """
+        Return the rows that contain none of exclude_mask and all of require_mask
+        """
+        if services:
+            groups = [self.groups[s] for s in services if s in self.groups]
+        else:
+            groups = self.groups.values()
+
+        results = []
+        for group in groups:
+            results.extend(group.search(exclude_mask, require_mask))
+        return results
+
+
+def allergen_index(snapshot):
+    """
+    Return the index for a catalog snapshot of allergen rows, built once
+    """
+    return snapshot.derive('allergen_index', AllergenIndex)
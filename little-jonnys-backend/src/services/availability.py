@@ -0,0 +1,149 @@
+import os
+from datetime import date, timedelta
+from src.services.booking_events import subscribe
+from src.services.booking_index import COMMITTED_STATUSES, RELEASED_STATUSES, BookingIndex, register_index
+
+# Per-day count of bookings holding each piece of kit. Built from Supabase
+# at startup by the booking index refresher and kept current by booking events.
+# Only committed bookings (paid or confirmed) use up capacity, so unpaid
+# enquiries can't fill the calendar; they are counted separately as pending.
+DEFAULT_RANGE_DAYS = 90
+MAX_RANGE_DAYS = 366
+
+SERVICE_COLUMNS = {
+    'hog_roast': 'hog_roast_selected',
+    'pizza': 'pizza_selected',
+    'bar': 'bar_selected',
+    'buffet': 'buffet_selected'
+}
+
+
+def _parse_capacity(value):
+    capacity = {}
+    for part in value.split(','):
+        service, _, count = part.partition('=')
+        service = service.strip()
+        if service in SERVICE_COLUMNS:
+            capacity[service] = int(count)
+    return capacity
+
+
+# How many events each service can cover on one day, e.g. "hog_roast=2,pizza=1,bar=1"
+SERVICE_CAPACITY = _parse_capacity(os.getenv('AVAILABILITY_CAPACITY', 'hog_roast=1,pizza=1,bar=1'))
+
+
+def _event_day(value):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+class AvailabilityIndex(BookingIndex):
+    """
+    Booked counts per day and service, updated in place as bookings change
+    """
+
+    COLUMNS = ['id', 'event_date', 'status'] + list(SERVICE_COLUMNS.values())
+    STATE = ('_bookings', '_days', '_pending')
+
+    def _reset(self):
+        # booking id -> {'day', 'status', 'services'}
+        self._bookings = {}
+        # day -> {service: committed bookings holding it}
+        self._days = {}
+        # day -> {service: open enquiries asking for it}
+        self._pending = {}
+
+    def _status(self, booking_id):
+        entry = self._bookings.get(booking_id)
+        return entry['status'] if entry else None
+
+    def _counts_for(self, entry):
+        """
+        The per-day counts this booking belongs in, or None
+        """
+        if entry['day'] is None or entry['status'] in RELEASED_STATUSES:
+            return None
+        return self._days if entry['status'] in COMMITTED_STATUSES else self._pending
+
+    def _count(self, entry, delta):
+        days = self._counts_for(entry)
+        if days is None:
+            return
+        counts = days.setdefault(entry['day'], {})
+        for service in entry['services']:
+            counts[service] = counts.get(service, 0) + delta
+            if not counts[service]:
+                del counts[service]
+        if not counts:
+            del days[entry['day']]
+
+    def _apply(self, booking):
+        booking_id = booking.get('id')
+        if not booking_id:
+            return
+        booking_id = str(booking_id)
+        previous = self._bookings.get(booking_id)
+
+        if previous is None:
+            # Partial events (payments) for bookings we haven't seen are
+            # picked up by the next refresh
+            if 'event_date' not in booking:
+                return
+            entry = {'day': None, 'status': None, 'services': ()}
+        else:
+            entry = dict(previous)
+
+        if 'event_date' in booking:
+            entry['day'] = _event_day(booking['event_date'])
+        if booking.get('status'):
+            entry['status'] = booking['status']
+        if any(column in booking for column in SERVICE_COLUMNS.values()):
+            selected = {
+                service for service, column in SERVICE_COLUMNS.items()
+                if booking.get(column, previous and service in previous['services'])
+            }
+            entry['services'] = tuple(service for service in SERVICE_CAPACITY if service in selected)
+
+        if previous is not None:
+            self._count(previous, -1)
+        self._count(entry, 1)
+        self._bookings[booking_id] = entry
+
+    def calendar(self, start, end, services):
+        """
+        Return one entry per day from start to end inclusive with the booked
+        and remaining capacity of each requested service, and how many
+        unconfirmed enquiries ask for it
+        """
+        result = []
+        day = start
+        with self._lock:
+            while day <= end:
+                counts = self._days.get(day, {})
+                pending = self._pending.get(day, {})
+                day_services = {}
+                full = True
+                for service in services:
+                    booked = counts.get(service, 0)
+                    available = max(0, SERVICE_CAPACITY[service] - booked)
+                    day_services[service] = {
+                        'booked': booked, 'available': available, 'pending': pending.get(service, 0)
+                    }
+                    if available:
+                        full = False
+                result.append({'date': day.isoformat(), 'full': full, 'services': day_services})
+                day += timedelta(days=1)
+        return result
+
+
+availability_index = register_index(AvailabilityIndex())
+
+
+@subscribe
+def _on_booking_event(event, booking):
+    availability_index.apply(event, booking)
+
@@ -0,0 +1,50 @@
+import os
+import threading
+
+
+class BackgroundWorker:
+    """
+    Runs target() on daemon threads until stopped. target returns True when
+    it did some work (run again straight away) and False when idle (sleep for
+    interval seconds or until wake() is called).
+    """
+
+    def __init__(self, name, target, interval=5, threads=1):
+        self.name = name
+        self.target = target
+        self.interval = interval
+        self.threads = threads
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        # Threads don't survive a fork, so each worker process starts its own
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            for i in range(self.threads):
+                thread = threading.Thread(target=self._run, name=f'{self.name}-{i}', daemon=True)
+                thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                busy = self.target()
+            except Exception as e:
+                print(f"{self.name} failed: {e}")
+                busy = False
+
+            if not busy:
+                self._wake.wait(self.interval)
+                self._wake.clear()
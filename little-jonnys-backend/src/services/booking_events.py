@@ -0,0 +1,28 @@
+# In-process notifications about booking changes, so indexes built from
+# bookings can stay current without polling Supabase. Subscribers are called
+# synchronously on the request or worker thread and should be quick.
+#
+# Events:
+#     created        - a new booking, with every column
+#     updated        - an admin edit, with every column
+#     paid           - a deposit was paid; id, status and payment columns
+#     payment_failed - a deposit payment failed; id and status
+#     refunded       - the deposit was refunded; id and status
+
+_subscribers = []
+
+
+def subscribe(fn):
+    """
+    Register fn(event, booking) to be called for every booking event
+    """
+    _subscribers.append(fn)
+    return fn
+
+
+def publish(event, booking):
+    for fn in list(_subscribers):
+        try:
+            fn(event, booking)
+        except Exception as e:
+            print(f"Booking event subscriber {fn.__name__} failed on {event}: {e}")
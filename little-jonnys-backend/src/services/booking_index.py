@@ -0,0 +1,137 @@
+import os
+import threading
+from src.config.supabase import get_supabase
+from src.services.background import BackgroundWorker
+from src.services.booking_outbox import iter_unsent_bookings
+from src.services.booking_pages import iter_bookings, parse_fields
+
+# In-memory indexes built from bookings (availability, admin search,
+# dashboard stats). Each is kept current by booking events, and one
+# periodic scan of every booking rebuilds them all together, so bookings
+# taken by other worker processes are picked up too.
+REFRESH_SECONDS = int(os.getenv('BOOKING_INDEX_REFRESH_SECONDS', '120'))
+
+PAID_STATUS = 'deposit_paid'
+# Bookings in these states no longer hold the date or count towards guests
+RELEASED_STATUSES = ('cancelled', 'declined', 'payment_failed', 'refunded')
+# Only these take up capacity; anything else not released is an enquiry
+COMMITTED_STATUSES = (PAID_STATUS, 'confirmed')
+
+_indexes = []
+
+
+class BookingIndex:
+    """
+    Base for an index built from bookings. Subclasses keep their data in the
+    attributes named in STATE, set up by _reset(), and implement _apply() to
+    fold one booking (a full row or an event's partial one) into them.
+    COLUMNS are the booking columns the index needs from the scan.
+    """
+
+    COLUMNS = ()
+    STATE = ()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        # Events that arrive during a rebuild, applied again on top of it
+        self._replay = None
+        self.loaded = False
+
+    def _reset(self):
+        raise NotImplementedError
+
+    def _apply(self, booking):
+        raise NotImplementedError
+
+    def _status(self, booking_id):
+        """
+        The booking's current status in this index, or None
+        """
+        return None
+
+    def _superseded(self, event, booking):
+        # A later successful attempt wins, as in the Supabase update
+        return event == 'payment_failed' and self._status(str(booking.get('id'))) == PAID_STATUS
+
+    def apply(self, event, booking):
+        with self._lock:
+            if self._superseded(event, booking):
+                return
+            self._apply(booking)
+            if self._replay is not None:
+                self._replay.append((event, booking))
+
+    def _begin_load(self):
+        with self._lock:
+            self._replay = []
+        return type(self)()
+
+    def _cancel_load(self):
+        with self._lock:
+            self._replay = None
+
+    def _finish_load(self, fresh):
+        with self._lock:
+            replay, self._replay = self._replay, None
+            for name in self.STATE:
+                setattr(self, name, getattr(fresh, name))
+            for event, booking in replay:
+                if not self._superseded(event, booking):
+                    self._apply(booking)
+            self.loaded = True
+
+
+def register_index(index):
+    """
+    Include an index in the periodic rebuild
+    """
+    _indexes.append(index)
+    return index
+
+
+def rebuild(indexes, rows):
+    """
+    Feed every row to fresh copies of the indexes, then swap them in
+    """
+    fresh = [index._begin_load() for index in indexes]
+    try:
+        for row in rows:
+            for copy in fresh:
+                copy._apply(row)
+    except BaseException:
+        for index in indexes:
+            index._cancel_load()
+        raise
+
+    for index, copy in zip(indexes, fresh):
+        index._finish_load(copy)
+
+
+def _scan_columns(indexes):
+    columns = []
+    for index in indexes:
+        columns.extend(column for column in index.COLUMNS if column not in columns)
+    return parse_fields(','.join(columns))
+
+
+def all_bookings(columns='*'):
+    supabase = get_supabase()
+    if supabase:
+        yield from iter_bookings(supabase, columns)
+    # Bookings still in the outbox aren't in Supabase yet
+    yield from iter_unsent_bookings()
+
+
+def refresh_indexes():
+    indexes = list(_indexes)
+    if indexes:
+        rebuild(indexes, all_bookings(_scan_columns(indexes)))
+    return False
+
+
+index_refresher = BackgroundWorker('booking-indexes', refresh_indexes, interval=REFRESH_SECONDS)
+
+
+def start_booking_indexes():
+    index_refresher.start()
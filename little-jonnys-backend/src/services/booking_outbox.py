@@ -0,0 +1,340 @@
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from src.config.supabase import get_supabase
+from src.services.background import BackgroundWorker
+from src.services.circuit_breaker import CircuitOpenError, upstream_available
+from src.services.local_db import ensure_schema, get_connection, transaction
+from src.services.metrics import OUTBOX_ROWS
+
+# New bookings are written here first and copied to Supabase in batches by
+# a background flusher, so a slow upstream never holds up the booking form.
+# Edits to bookings already in Supabase are queued here too while its
+# circuit breaker is open, and applied in order once it recovers. Sent rows
+# hold customer details, so they are deleted after RETENTION_SECONDS.
+FLUSH_BATCH_SIZE = 50
+FLUSH_INTERVAL_SECONDS = 2
+MAX_ATTEMPTS = 10
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 900
+STALE_LOCK_SECONDS = 300
+# Bookings that still failed after MAX_ATTEMPTS are tried again this often
+FAILED_RETRY_SECONDS = 3600
+RETENTION_SECONDS = 24 * 3600
+PRUNE_INTERVAL_SECONDS = 300
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS booking_outbox (
+    id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    locked_at REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_booking_outbox_due ON booking_outbox (status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS booking_updates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    booking_id TEXT NOT NULL,
+    changes TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    locked_at REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_booking_updates_booking ON booking_updates (booking_id, status);
+CREATE INDEX IF NOT EXISTS idx_booking_updates_status ON booking_updates (status, sent_at);
+'''
+
+_last_prune = 0
+
+
+def add_booking(booking_data):
+    """
+    Store a booking locally and return its id. The same id is sent to
+    Supabase, so it stays valid once the booking has been flushed.
+    """
+    ensure_schema(SCHEMA)
+    booking_id = str(uuid.uuid4())
+    now = time.time()
+
+    row = dict(booking_data)
+    row['id'] = booking_id
+    row['created_at'] = datetime.now(timezone.utc).isoformat()
+
+    get_connection().execute(
+        'INSERT INTO booking_outbox (id, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)',
+        (booking_id, json.dumps(row), now, now)
+    )
+    outbox_flusher.wake()
+    return booking_id, row
+
+
+def get_unsent_booking(booking_id):
+    """
+    Return a booking that hasn't reached Supabase yet, or None
+    """
+    ensure_schema(SCHEMA)
+    row = get_connection().execute(
+        "SELECT payload FROM booking_outbox WHERE id = ? AND status != 'sent'",
+        (booking_id,)
+    ).fetchone()
+    return json.loads(row['payload']) if row else None
+
+
+def update_unsent_booking(booking_id, changes):
+    """
+    Apply changes to a booking that is still waiting to be sent. Returns the
+    updated booking, or None if it is not waiting in the outbox.
+    """
+    ensure_schema(SCHEMA)
+    with transaction() as conn:
+        row = conn.execute(
+            "SELECT payload FROM booking_outbox WHERE id = ? AND status IN ('pending', 'failed')",
+            (booking_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        booking = json.loads(row['payload'])
+        booking.update(changes)
+        booking['id'] = booking_id
+        conn.execute('UPDATE booking_outbox SET payload = ? WHERE id = ?', (json.dumps(booking), booking_id))
+    return booking
+
+
+def queue_booking_update(booking_id, changes):
+    """
+    Store an edit to a booking that is already in Supabase, to be applied
+    by the flusher
+    """
+    ensure_schema(SCHEMA)
+    now = time.time()
+    get_connection().execute(
+        'INSERT INTO booking_updates (booking_id, changes, next_attempt_at, created_at) VALUES (?, ?, ?, ?)',
+        (booking_id, json.dumps(changes), now, now)
+    )
+    outbox_flusher.wake()
+
+
+def pending_booking_changes(booking_id):
+    """
+    Queued edits for a booking merged in order, or None if there are none
+    """
+    ensure_schema(SCHEMA)
+    rows = get_connection().execute(
+        "SELECT changes FROM booking_updates WHERE booking_id = ? AND status != 'sent' ORDER BY id",
+        (booking_id,)
+    ).fetchall()
+    if not rows:
+        return None
+    changes = {}
+    for row in rows:
+        changes.update(json.loads(row['changes']))
+    return changes
+
+
+def iter_unsent_bookings():
+    """
+    Yield every booking that hasn't reached Supabase yet
+    """
+    ensure_schema(SCHEMA)
+    rows = get_connection().execute("SELECT payload FROM booking_outbox WHERE status != 'sent'").fetchall()
+    for row in rows:
+        yield json.loads(row['payload'])
+
+
+def _claim_batch():
+    now = time.time()
+    with transaction() as conn:
+        rows = conn.execute(
+            '''SELECT id, payload, attempts FROM booking_outbox
+               WHERE (status IN ('pending', 'failed') AND next_attempt_at <= ?)
+                  OR (status = 'sending' AND locked_at < ?)
+               ORDER BY created_at LIMIT ?''',
+            (now, now - STALE_LOCK_SECONDS, FLUSH_BATCH_SIZE)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE booking_outbox SET status = 'sending', locked_at = ? WHERE id = ?",
+            [(now, row['id']) for row in rows]
+        )
+    return rows
+
+
+def _mark_sent(rows):
+    now = time.time()
+    get_connection().executemany(
+        "UPDATE booking_outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+        [(now, row['id']) for row in rows]
+    )
+
+
+def _mark_failed(row, error, table='booking_outbox'):
+    attempts = row['attempts'] + 1
+    if attempts >= MAX_ATTEMPTS:
+        # Kept locally rather than dropped. Bookings are tried again after a
+        # long wait, as the insert is safe to repeat; a failed edit is left
+        # for an admin, since later edits to the booking may have landed.
+        label = 'Booking' if table == 'booking_outbox' else 'Booking update'
+        print(f"{label} {row['id']} could not be sent to Supabase after {attempts} attempts: {error}")
+        status, next_attempt_at = 'failed', time.time() + FAILED_RETRY_SECONDS
+    else:
+        status = 'pending'
+        next_attempt_at = time.time() + min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempts)
+    get_connection().execute(
+        f'UPDATE {table} SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ? WHERE id = ?',
+        (status, attempts, error, next_attempt_at, row['id'])
+    )
+
+
+def _release(rows, error, table='booking_outbox'):
+    # The breaker opened mid-batch; try again once it may have closed,
+    # without using up an attempt
+    get_connection().executemany(
+        f"UPDATE {table} SET status = 'pending', last_error = ?, next_attempt_at = ? WHERE id = ?",
+        [(str(error), time.time() + error.retry_after, row['id']) for row in rows]
+    )
+
+
+def _insert(supabase, rows):
+    """
+    Insert rows into Supabase. Rows whose id already exists there (a retry
+    after a lost response) are left as they are rather than overwritten.
+    """
+    from postgrest.types import ReturnMethod
+
+    bookings = [json.loads(row['payload']) for row in rows]
+    supabase.table('bookings').upsert(
+        bookings, on_conflict='id', ignore_duplicates=True, returning=ReturnMethod.minimal
+    ).execute()
+
+
+def _flush_inserts(supabase):
+    rows = _claim_batch()
+    if not rows:
+        return False
+
+    try:
+        _insert(supabase, rows)
+        _mark_sent(rows)
+        return True
+    except CircuitOpenError as e:
+        _release(rows, e)
+        return False
+    except Exception as e:
+        if len(rows) == 1:
+            _mark_failed(rows[0], str(e))
+            return False
+
+    # One bad row shouldn't hold back the rest of the batch
+    for index, row in enumerate(rows):
+        try:
+            _insert(supabase, [row])
+            _mark_sent([row])
+        except CircuitOpenError as e:
+            _release(rows[index:], e)
+            break
+        except Exception as e:
+            _mark_failed(row, str(e))
+    return True
+
+
+def _claim_updates():
+    # Only the oldest queued edit per booking, so edits land in order
+    now = time.time()
+    with transaction() as conn:
+        rows = conn.execute(
+            '''SELECT id, booking_id, changes, attempts FROM booking_updates
+               WHERE id IN (
+                   SELECT MIN(id) FROM booking_updates
+                   WHERE status IN ('pending', 'sending') GROUP BY booking_id
+               )
+               AND ((status = 'pending' AND next_attempt_at <= ?)
+                    OR (status = 'sending' AND locked_at < ?))
+               ORDER BY id LIMIT ?''',
+            (now, now - STALE_LOCK_SECONDS, FLUSH_BATCH_SIZE)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE booking_updates SET status = 'sending', locked_at = ? WHERE id = ?",
+            [(now, row['id']) for row in rows]
+        )
+    return rows
+
+
+def _flush_updates(supabase):
+    rows = _claim_updates()
+    for index, row in enumerate(rows):
+        try:
+            supabase.table('bookings').update(json.loads(row['changes'])).eq('id', row['booking_id']).execute()
+            get_connection().execute(
+                "UPDATE booking_updates SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                (time.time(), row['id'])
+            )
+        except CircuitOpenError as e:
+            _release(rows[index:], e, 'booking_updates')
+            return False
+        except Exception as e:
+            _mark_failed(row, str(e), 'booking_updates')
+    return bool(rows)
+
+
+def flush_outbox():
+    """
+    Send one batch of pending bookings, then queued edits, to Supabase.
+    Returns True if anything was sent, so the flusher keeps going while
+    there is a backlog.
+    """
+    ensure_schema(SCHEMA)
+    _prune()
+    supabase = get_supabase()
+    if not supabase or not upstream_available('bookings'):
+        return False
+
+    inserted = _flush_inserts(supabase)
+    updated = _flush_updates(supabase)
+    return inserted or updated
+
+
+def _prune():
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < PRUNE_INTERVAL_SECONDS:
+        return
+    _last_prune = now
+    conn = get_connection()
+    for table in ('booking_outbox', 'booking_updates'):
+        conn.execute(f"DELETE FROM {table} WHERE status = 'sent' AND sent_at < ?", (now - RETENTION_SECONDS,))
+
+
+@OUTBOX_ROWS.collect_with
+def _row_counts():
+    ensure_schema(SCHEMA)
+    conn = get_connection()
+    counts = {}
+    for table, queue in (('booking_outbox', 'inserts'), ('booking_updates', 'updates')):
+        for status in ('pending', 'sending', 'failed', 'sent'):
+            counts[(queue, status)] = 0
+        for row in conn.execute(f'SELECT status, COUNT(*) AS count FROM {table} GROUP BY status'):
+            counts[(queue, row['status'])] = row['count']
+    return counts
+
+
+def outbox_stats():
+    stats = {'inserts': {}, 'updates': {}}
+    for (queue, status), count in _row_counts().items():
+        stats[queue][status] = count
+    return stats
+
+
+outbox_flusher = BackgroundWorker('booking-outbox', flush_outbox, interval=FLUSH_INTERVAL_SECONDS)
+
+
+def start_outbox_flusher():
+    ensure_schema(SCHEMA)
+    outbox_flusher.start()
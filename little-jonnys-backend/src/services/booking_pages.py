@@ -0,0 +1,102 @@
+import re
+import json
+import base64
+
+# Bookings are listed newest first and paged with a keyset cursor on
+# (created_at, id), so each page costs the same however many rows precede it
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+EXPORT_PAGE_SIZE = 500
+
+CURSOR_COLUMNS = ['created_at', 'id']
+
+# Columns of the bookings table that ?fields= may ask for
+BOOKING_COLUMNS = frozenset([
+    'id', 'created_at', 'status', 'client_name', 'client_email', 'client_phone',
+    'event_location', 'event_date', 'arrival_time', 'power_water', 'dietary_notes', 'special_requests',
+    'hog_roast_selected', 'hog_roast_guests', 'pizza_selected', 'pizza_guests',
+    'bar_selected', 'bar_guests', 'buffet_selected', 'buffet_guests', 'buffet_package',
+    'canapes', 'sandwiches', 'cakes', 'deposit_paid', 'deposit_amount', 'stripe_session_id'
+])
+
+_COLUMN_NAME = re.compile(r'^[a-z_][a-z0-9_]*$')
+
+
+def parse_fields(value):
+    """
+    Turn ?fields=a,b,c into a PostgREST select list, always including the
+    cursor columns. Returns '*' when no projection was asked for. Raises
+    ValueError for a name that isn't a bookings column.
+    """
+    if not value:
+        return '*'
+
+    fields = []
+    for name in value.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if not _COLUMN_NAME.match(name):
+            raise ValueError(f'Invalid field: {name}')
+        if name not in BOOKING_COLUMNS:
+            raise ValueError(f'Unknown field: {name}')
+        if name not in fields:
+            fields.append(name)
+
+    for column in CURSOR_COLUMNS:
+        if column not in fields:
+            fields.append(column)
+
+    return ','.join(fields)
+
+
+def encode_cursor(row):
+    raw = json.dumps([row['created_at'], row['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, booking_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return str(created_at), str(booking_id)
+
+
+def _quote(value):
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def fetch_page(supabase, columns='*', limit=DEFAULT_PAGE_SIZE, cursor=None):
+    """
+    Fetch one page of bookings after the cursor, returning (rows, next_cursor)
+    """
+    query = supabase.table('bookings').select(columns)
+
+    if cursor:
+        created_at, booking_id = decode_cursor(cursor)
+        query = query.or_(
+            f'created_at.lt.{_quote(created_at)},'
+            f'and(created_at.eq.{_quote(created_at)},id.lt.{_quote(booking_id)})'
+        )
+
+    # Ask for one extra row to learn whether another page exists
+    result = query.order('created_at', desc=True).order('id', desc=True).limit(limit + 1).execute()
+    rows = result.data
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def iter_bookings(supabase, columns='*', page_size=EXPORT_PAGE_SIZE):
+    """
+    Yield every booking, newest first, fetching from Supabase a page at a time
+    """
+    cursor = None
+    while True:
+        rows, cursor = fetch_page(supabase, columns, page_size, cursor)
+        yield from rows
+        if cursor is None:
+            break
@@ -0,0 +1,176 @@
+import re
+import bisect
+from src.services.booking_events import subscribe
+from src.services.booking_index import BookingIndex, register_index
+
+# Inverted index over booking contact details for admin lookups. Every query
+# word is matched as a prefix, so "jo smi" finds "John Smith". Kept current
+# by booking events and rebuilt periodically with the other booking indexes.
+DEFAULT_RESULTS = 20
+MAX_RESULTS = 100
+
+# Indexed column -> weight of a match in that column
+FIELD_WEIGHTS = {
+    'client_name': 3,
+    'client_email': 2,
+    'client_phone': 2,
+    'event_location': 1
+}
+
+# Returned with every hit so the admin can pick the right booking
+RESULT_COLUMNS = ['id', 'client_name', 'client_email', 'client_phone', 'event_location', 'event_date', 'status', 'created_at']
+
+_WORD = re.compile(r'[a-z0-9]+')
+_PHONE = re.compile(r'^[0-9 +()-]*[0-9][0-9 +()-]*$')
+
+
+def _tokens(field, value):
+    if not value:
+        return set()
+    value = str(value).lower()
+    tokens = set(_WORD.findall(value))
+    if field == 'client_email':
+        # The whole address and its local part, as well as each word
+        tokens.add(value)
+        tokens.add(value.split('@', 1)[0])
+    elif field == 'client_phone':
+        digits = ''.join(ch for ch in value if ch.isdigit())
+        if digits:
+            tokens.add(digits)
+            if digits.startswith('44'):
+                tokens.add('0' + digits[2:])
+    return tokens
+
+
+def query_tokens(q):
+    """
+    Split a search box entry into the prefixes that must all match
+    """
+    q = q.lower()
+    tokens = _WORD.findall(q)
+    # Let people search by a full email address or a phone number with spaces
+    tokens.extend(part for part in q.split() if '@' in part)
+    if _PHONE.match(q):
+        tokens = [''.join(ch for ch in q if ch.isdigit())]
+    return tokens
+
+
+class BookingSearchIndex(BookingIndex):
+    """
+    Token -> {booking id: weight} postings with a sorted token list for
+    prefix lookups
+    """
+
+    COLUMNS = RESULT_COLUMNS
+    STATE = ('_docs', '_doc_tokens', '_postings', '_sorted_tokens')
+
+    def _reset(self):
+        self._docs = {}
+        self._doc_tokens = {}
+        self._postings = {}
+        self._sorted_tokens = []
+
+    def _status(self, booking_id):
+        doc = self._docs.get(booking_id)
+        return doc.get('status') if doc else None
+
+    def _remove(self, booking_id):
+        for token in self._doc_tokens.pop(booking_id, {}):
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(booking_id, None)
+            if not posting:
+                del self._postings[token]
+                index = bisect.bisect_left(self._sorted_tokens, token)
+                if index < len(self._sorted_tokens) and self._sorted_tokens[index] == token:
+                    del self._sorted_tokens[index]
+
+    def _add(self, booking_id, doc):
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in _tokens(field, doc.get(field)):
+                weights[token] = max(weights.get(token, 0), weight)
+        for token, weight in weights.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                bisect.insort(self._sorted_tokens, token)
+            posting[booking_id] = weight
+        self._doc_tokens[booking_id] = weights
+        self._docs[booking_id] = doc
+
+    def _apply(self, booking):
+        booking_id = booking.get('id')
+        if not booking_id:
+            return
+        booking_id = str(booking_id)
+        previous = self._docs.get(booking_id)
+        if previous is None and not any(field in booking for field in FIELD_WEIGHTS):
+            # A payment event for a booking we haven't loaded yet
+            return
+
+        doc = dict(previous or {})
+        doc.update({column: booking[column] for column in RESULT_COLUMNS if column in booking})
+        doc['id'] = booking_id
+
+        if previous is not None and not any(doc.get(f) != previous.get(f) for f in FIELD_WEIGHTS):
+            self._docs[booking_id] = doc
+            return
+        self._remove(booking_id)
+        self._add(booking_id, doc)
+
+    def _prefix_scores(self, prefix):
+        """
+        Best weight per booking over every token starting with prefix; whole
+        word matches count double
+        """
+        scores = {}
+        index = bisect.bisect_left(self._sorted_tokens, prefix)
+        while index < len(self._sorted_tokens) and self._sorted_tokens[index].startswith(prefix):
+            token = self._sorted_tokens[index]
+            factor = 2 if token == prefix else 1
+            for booking_id, weight in self._postings[token].items():
+                score = weight * factor
+                if score > scores.get(booking_id, 0):
+                    scores[booking_id] = score
+            index += 1
+        return scores
+
+    def search(self, q, limit=DEFAULT_RESULTS, offset=0):
+        """
+        Return (page of bookings, total matches). Every query word has to
+        match; results are ranked by score, then newest event first.
+        """
+        tokens = query_tokens(q)
+        if not tokens:
+            return [], 0
+
+        with self._lock:
+            scores = None
+            for token in sorted(set(tokens), key=len, reverse=True):
+                token_scores = self._prefix_scores(token)
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {
+                        booking_id: score + token_scores[booking_id]
+                        for booking_id, score in scores.items() if booking_id in token_scores
+                    }
+                if not scores:
+                    return [], 0
+
+            # Highest score first, newest event first among equal scores
+            ranked = sorted(scores.items(), key=lambda item: str(self._docs[item[0]].get('event_date') or ''), reverse=True)
+            ranked.sort(key=lambda item: -item[1])
+            page = [dict(self._docs[booking_id], score=score) for booking_id, score in ranked[offset:offset + limit]]
+        return page, len(ranked)
+
+
+booking_search_index = register_index(BookingSearchIndex())
+
+
+@subscribe
+def _on_booking_event(event, booking):
+    booking_search_index.apply(event, booking)
+
@@ -0,0 +1,131 @@
+from datetime import datetime, timezone
+from src.services.booking_events import subscribe
+from src.services.booking_index import RELEASED_STATUSES, BookingIndex, register_index
+
+# Running totals for the admin dashboard. Each booking's contribution is
+# remembered so an event can take the old one away and add the new one;
+# the periodic rebuild of the booking indexes corrects anything that drifted.
+
+# service -> (selected column, guests column)
+SERVICES = {
+    'hog_roast': ('hog_roast_selected', 'hog_roast_guests'),
+    'pizza': ('pizza_selected', 'pizza_guests'),
+    'bar': ('bar_selected', 'bar_guests'),
+    'buffet': ('buffet_selected', 'buffet_guests')
+}
+
+TRACKED_COLUMNS = ['id', 'status', 'created_at', 'deposit_paid', 'deposit_amount'] + [
+    column for columns in SERVICES.values() for column in columns
+]
+
+
+def _contribution(fields):
+    """
+    (status, deposit month, deposit in pence, {service: guests}) for one booking
+    """
+    status = fields.get('status') or 'pending'
+
+    deposit = 0
+    month = None
+    if fields.get('deposit_paid') and fields.get('deposit_amount'):
+        # Deposits are taken at checkout, straight after the booking is made
+        deposit = round(float(fields['deposit_amount']) * 100)
+        month = str(fields.get('created_at') or '')[:7] or None
+
+    guests = {}
+    if status not in RELEASED_STATUSES:
+        for service, (selected, guests_column) in SERVICES.items():
+            if fields.get(selected):
+                guests[service] = int(fields.get(guests_column) or 0)
+
+    return status, month, deposit, guests
+
+
+class BookingStats(BookingIndex):
+    """
+    Booking counts by status, deposits by month and guests per service
+    """
+
+    COLUMNS = TRACKED_COLUMNS
+    STATE = ('_fields', '_by_status', '_deposits', '_services')
+
+    def __init__(self):
+        super().__init__()
+        self.recomputed_at = None
+
+    def _reset(self):
+        self._fields = {}
+        self._by_status = {}
+        self._deposits = {}
+        self._services = {}
+
+    def _status(self, booking_id):
+        fields = self._fields.get(booking_id)
+        return fields.get('status') if fields else None
+
+    def _add(self, contribution, sign):
+        status, month, deposit, guests = contribution
+        self._by_status[status] = self._by_status.get(status, 0) + sign
+        if not self._by_status[status]:
+            del self._by_status[status]
+        if deposit:
+            totals = self._deposits.setdefault(month, [0, 0])
+            totals[0] += sign * deposit
+            totals[1] += sign
+            if not totals[1]:
+                del self._deposits[month]
+        for service, count in guests.items():
+            totals = self._services.setdefault(service, [0, 0])
+            totals[0] += sign
+            totals[1] += sign * count
+
+    def _apply(self, booking):
+        booking_id = booking.get('id')
+        if not booking_id:
+            return
+        booking_id = str(booking_id)
+        previous = self._fields.get(booking_id)
+        if previous is None and 'created_at' not in booking:
+            # A payment event for a booking we haven't loaded yet
+            return
+
+        fields = dict(previous or {})
+        fields.update({column: booking[column] for column in TRACKED_COLUMNS if column in booking})
+        if previous is not None:
+            self._add(_contribution(previous), -1)
+        self._add(_contribution(fields), 1)
+        self._fields[booking_id] = fields
+
+    def _finish_load(self, fresh):
+        super()._finish_load(fresh)
+        self.recomputed_at = datetime.now(timezone.utc).isoformat()
+
+    def snapshot(self):
+        with self._lock:
+            deposits = {
+                month: {'amount': pence / 100, 'count': count}
+                for month, (pence, count) in sorted(self._deposits.items(), key=lambda item: item[0] or '')
+            }
+            return {
+                'bookings': len(self._fields),
+                'by_status': dict(self._by_status),
+                'deposits': {
+                    'total': sum(pence for pence, _ in self._deposits.values()) / 100,
+                    'count': sum(count for _, count in self._deposits.values()),
+                    'by_month': deposits
+                },
+                'services': {
+                    service: {'bookings': bookings, 'guests': guests}
+                    for service, (bookings, guests) in self._services.items()
+                },
+                'recomputed_at': self.recomputed_at
+            }
+
+
+booking_stats = register_index(BookingStats())
+
+
+@subscribe
+def _on_booking_event(event, booking):
+    booking_stats.apply(event, booking)
+
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from src.services.background import BackgroundWorker
+from src.services.booking_events import subscribe
+from src.services.local_db import ensure_schema, get_connection
+
+# Booking changes pushed to admin dashboards over Server-Sent Events.
+# Every booking event is appended to a capped table in the local database,
+# which gives events one sequence of ids across all worker processes. Each
+# process tails the table into an in-memory ring buffer that its stream
+# connections read from, so a client that reconnects with Last-Event-ID to
+# any worker gets what it missed.
+STREAM_BUFFER_SIZE = int(os.getenv('STREAM_BUFFER_SIZE', '1000'))
+STREAM_POLL_SECONDS = float(os.getenv('STREAM_POLL_SECONDS', '1'))
+# Each open stream holds a worker thread, so only a few are allowed per
+# process and each is closed after a while; EventSource reconnects by itself
+STREAM_MAX_CLIENTS = int(os.getenv('STREAM_MAX_CLIENTS', '4'))
+STREAM_MAX_SECONDS = int(os.getenv('STREAM_MAX_SECONDS', '300'))
+HEARTBEAT_SECONDS = 15
+RECONNECT_MS = 3000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS booking_stream (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+'''
+
+
+class StreamFull(Exception):
+    """
+    Raised when this process already has STREAM_MAX_CLIENTS open streams
+    """
+
+
+class BookingStream:
+    """
+    The most recent booking events, as (id, event, data) with data already
+    serialised, and the streams waiting for more
+    """
+
+    def __init__(self, size=STREAM_BUFFER_SIZE):
+        self._events = deque(maxlen=size)
+        self._last_id = None
+        self._changed = threading.Condition()
+        self._poll_lock = threading.Lock()
+        self._clients = 0
+
+    def append(self, event, booking):
+        """
+        Store an event for every process's streams
+        """
+        ensure_schema(SCHEMA)
+        conn = get_connection()
+        cursor = conn.execute(
+            'INSERT INTO booking_stream (event, data, created_at) VALUES (?, ?, ?)',
+            (event, json.dumps(booking, default=str, separators=(',', ':')), time.time())
+        )
+        conn.execute('DELETE FROM booking_stream WHERE id <= ?', (cursor.lastrowid - STREAM_BUFFER_SIZE,))
+        stream_tailer.wake()
+
+    def poll(self):
+        """
+        Copy events added since the last poll into the ring buffer. Returns
+        True if there may be more to read.
+        """
+        ensure_schema(SCHEMA)
+        conn = get_connection()
+        with self._poll_lock:
+            after = self._last_id
+            if after is None:
+                newest = conn.execute('SELECT MAX(id) FROM booking_stream').fetchone()[0] or 0
+                after = max(0, newest - self._events.maxlen)
+
+            rows = conn.execute(
+                'SELECT id, event, data FROM booking_stream WHERE id > ? ORDER BY id LIMIT 500',
+                (after,)
+            ).fetchall()
+            with self._changed:
+                for row in rows:
+                    self._events.append((row['id'], row['event'], row['data']))
+                self._last_id = rows[-1]['id'] if rows else after
+                if rows:
+                    self._changed.notify_all()
+        return len(rows) == 500
+
+    def ensure_loaded(self):
+        # A stream can open before the tailer's first poll
+        if self._last_id is None:
+            self.poll()
+
+    @property
+    def last_id(self):
+        return self._last_id or 0
+
+    def events_after(self, last_id, timeout):
+        """
+        Events newer than last_id, waiting up to timeout seconds for one.
+        Returns (events, complete); complete is False when some events after
+        last_id have already dropped out of the buffer.
+        """
+        with self._changed:
+            if self.last_id <= last_id:
+                self._changed.wait(timeout)
+            if last_id > self.last_id:
+                # From before the local database was reset
+                return [], False
+            events = [entry for entry in self._events if entry[0] > last_id]
+            # Ids have no gaps, so a missing next id means it was dropped
+            complete = events[0][0] == last_id + 1 if events else last_id == self.last_id
+            return events, complete
+
+    def connect(self):
+        with self._changed:
+            if self._clients >= STREAM_MAX_CLIENTS:
+                raise StreamFull(f'Too many open streams (maximum {STREAM_MAX_CLIENTS} per worker)')
+            self._clients += 1
+
+    def disconnect(self):
+        with self._changed:
+            self._clients -= 1
+
+    def stats(self):
+        return {
+            'buffered': len(self._events),
+            'last_event_id': self.last_id,
+            'clients': self._clients
+        }
+
+
+booking_stream = BookingStream()
+
+
+@subscribe
+def _on_booking_event(event, booking):
+    booking_stream.append(event, booking)
+
+
+def _format(event_id, event, data):
+    return f'id: {event_id}\nevent: {event}\ndata: {data}\n\n'
+
+
+def stream_events(last_id):
+    """
+    Yield SSE messages from just after last_id (or from now when None)
+    until STREAM_MAX_SECONDS have passed
+    """
+    deadline = time.monotonic() + STREAM_MAX_SECONDS
+    booking_stream.ensure_loaded()
+    yield f'retry: {RECONNECT_MS}\n\n'
+
+    if last_id is None:
+        last_id = booking_stream.last_id
+        yield _format(last_id, 'ready', json.dumps({'last_event_id': last_id}))
+
+    while time.monotonic() < deadline:
+        events, complete = booking_stream.events_after(last_id, min(HEARTBEAT_SECONDS, deadline - time.monotonic()))
+        if not complete:
+            # The client missed more than the buffer holds; it should
+            # reload the booking list and carry on from here
+            last_id = booking_stream.last_id
+            yield _format(last_id, 'reset', json.dumps({'last_event_id': last_id}))
+            continue
+
+        if not events:
+            yield ': keepalive\n\n'
+            continue
+
+        for event_id, event, data in events:
+            yield _format(event_id, event, data)
+            last_id = event_id
+
+
+stream_tailer = BackgroundWorker('booking-stream', booking_stream.poll, interval=STREAM_POLL_SECONDS)
+
+
+def start_booking_stream():
+    stream_tailer.start()
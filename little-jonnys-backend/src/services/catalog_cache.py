@@ -0,0 +1,187 @@
+import os
+import time
+import hashlib
+import threading
+from flask import Response, current_app, request
+from src.services.metrics import record_fallback
+from src.services.singleflight import SingleFlight
+from src.services.compression import (
+    COMPRESS_MIN_SIZE, choose_encoding, compress, encoded_etag, etag_matches
+)
+
+# Catalog data (prices, allergens) changes rarely, so snapshots are kept in
+# process memory and revalidated by clients with ETags.
+CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', '300'))
+CATALOG_MAX_AGE = int(os.getenv('CATALOG_MAX_AGE', '60'))
+CATALOG_LOAD_TIMEOUT = float(os.getenv('CATALOG_LOAD_TIMEOUT', '10'))
+
+# If a reload fails, the last good snapshot is served and retried this often
+CATALOG_STALE_RETRY_SECONDS = 15
+
+
+class CatalogSnapshot:
+    """
+    An immutable copy of a catalog table plus anything derived from it
+    """
+
+    def __init__(self, table, version, data):
+        self.table = table
+        self.version = version
+        self.data = data
+        self.loaded_at = time.time()
+        self.expires_at = self.loaded_at + CATALOG_CACHE_TTL
+        self._derived = {}
+        self._lock = threading.RLock()
+
+    def is_fresh(self):
+        return time.time() < self.expires_at
+
+    def derive(self, name, build):
+        """
+        Build a value from the snapshot data once and reuse it until the
+        snapshot is replaced
+        """
+        value = self._derived.get(name)
+        if value is None:
+            with self._lock:
+                value = self._derived.get(name)
+                if value is None:
+                    value = build(self.data)
+                    self._derived[name] = value
+        return value
+
+
+class CatalogCache:
+    """
+    Versioned, TTL-bound snapshots of catalog queries, grouped by table so a
+    whole table can be invalidated at once
+    """
+
+    MAX_ENTRIES = 256
+
+    def __init__(self):
+        self._snapshots = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._loads = SingleFlight('catalog', timeout=CATALOG_LOAD_TIMEOUT)
+
+    def get(self, table, key, loader):
+        """
+        Return the current snapshot for a query on a table, reloading it
+        with loader() if it is missing or expired. Concurrent requests for
+        the same query share one reload.
+        """
+        snapshot = self._snapshots.get((table, key))
+        if snapshot is not None and snapshot.is_fresh():
+            return snapshot
+
+        return self._loads.do((table, key), lambda: self._reload(table, key, loader))
+
+    def _reload(self, table, key, loader):
+        # Another flight may have finished while this caller was on its way
+        snapshot = self._snapshots.get((table, key))
+        if snapshot is not None and snapshot.is_fresh():
+            return snapshot
+
+        # Loaders read the local catalog replica, which never waits on
+        # Supabase and holds the seed catalog until its first sync, so there
+        # is no upstream to check here
+        try:
+            data = loader()
+        except Exception as e:
+            if snapshot is None:
+                raise
+            print(f"Serving last good {table} snapshot: {e}")
+            return self._keep_stale(snapshot)
+
+        with self._lock:
+            version = self._versions.get(table, 0) + 1
+            self._versions[table] = version
+            snapshot = CatalogSnapshot(table, version, data)
+            if len(self._snapshots) >= self.MAX_ENTRIES:
+                oldest = min(self._snapshots, key=lambda k: self._snapshots[k].loaded_at)
+                del self._snapshots[oldest]
+            self._snapshots[(table, key)] = snapshot
+        return snapshot
+
+    def _keep_stale(self, snapshot):
+        record_fallback(f'{snapshot.table}_stale')
+        snapshot.expires_at = time.time() + CATALOG_STALE_RETRY_SECONDS
+        return snapshot
+
+    def invalidate(self, table=None):
+        """
+        Drop every snapshot for a table, or all snapshots when table is None
+        """
+        with self._lock:
+            if table is None:
+                self._snapshots.clear()
+            else:
+                for cache_key in [k for k in self._snapshots if k[0] == table]:
+                    del self._snapshots[cache_key]
+
+    def stats(self):
+        return {
+            f'{table}:{key}': {
+                'version': snapshot.version,
+                'age_seconds': round(time.time() - snapshot.loaded_at, 1),
+                'fresh': snapshot.is_fresh()
+            }
+            for (table, key), snapshot in list(self._snapshots.items())
+        }
+
+
+catalog_cache = CatalogCache()
+
+
+class _PreparedBody:
+    """
+    A serialised response body with its compressed variants, each built on
+    first request and kept with the snapshot
+    """
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        self._variants = {'identity': body}
+        self._lock = threading.Lock()
+
+    def variant(self, encoding):
+        data = self._variants.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._variants.get(encoding)
+                if data is None:
+                    data = compress(self.body, encoding, best=True)
+                    self._variants[encoding] = data
+        return data
+
+
+def catalog_response(snapshot, view, build):
+    """
+    Serialise and compress build(snapshot.data) once per snapshot and view,
+    and answer with a strong ETag so clients can revalidate with a 304
+    """
+    def prepare(data):
+        return _PreparedBody(current_app.json.dumps_bytes(build(data)))
+
+    prepared = snapshot.derive(('response', view), prepare)
+
+    encoding = 'identity'
+    if len(prepared.body) >= COMPRESS_MIN_SIZE:
+        encoding = choose_encoding()
+
+    headers = {
+        'ETag': encoded_etag(prepared.etag, encoding),
+        'Cache-Control': f'public, max-age={CATALOG_MAX_AGE}, must-revalidate',
+        'X-Catalog-Version': str(snapshot.version),
+        'Vary': 'Accept-Encoding'
+    }
+
+    if etag_matches(prepared.etag, request.headers.get('If-None-Match')):
+        return Response(status=304, headers=headers)
+
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+
+    return Response(prepared.variant(encoding), status=200, mimetype='application/json', headers=headers)
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import hashlib
+from src.config.supabase import get_supabase
+from src.services.background import BackgroundWorker
+from src.services.catalog_cache import catalog_cache
+from src.services.catalog_seed import SEED_ROWS
+from src.services.circuit_breaker import upstream_available
+from src.services.local_db import ensure_schema, get_connection, transaction
+from src.services.metrics import record_fallback
+
+# Local copy of the catalog tables. Reads never go to Supabase: one worker
+# process at a time pulls each table every REPLICA_SYNC_SECONDS, and until
+# the first pull succeeds the replica holds the seed catalog. Every change
+# bumps the table's version, and each process drops its cached snapshots
+# when it sees a new one.
+REPLICA_SYNC_SECONDS = int(os.getenv('REPLICA_SYNC_SECONDS', '60'))
+REPLICA_CHECK_SECONDS = int(os.getenv('REPLICA_CHECK_SECONDS', '10'))
+# Least time between syncs asked for through /catalog/invalidate
+MANUAL_SYNC_SECONDS = 10
+
+REPLICA_TABLES = tuple(SEED_ROWS)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS catalog_replica (
+    table_name TEXT NOT NULL,
+    id TEXT NOT NULL,
+    service_type TEXT,
+    active INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (table_name, id)
+);
+CREATE INDEX IF NOT EXISTS idx_catalog_replica_service ON catalog_replica (table_name, service_type, active, position);
+CREATE INDEX IF NOT EXISTS idx_catalog_replica_active ON catalog_replica (table_name, active, service_type, position);
+CREATE TABLE IF NOT EXISTS catalog_versions (
+    table_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    checksum TEXT NOT NULL,
+    source TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    synced_at REAL NOT NULL,
+    sync_started_at REAL,
+    last_error TEXT
+);
+'''
+
+# Version of each table this process last served, so the refresher knows
+# when cached snapshots are out of date
+_served_versions = {}
+
+
+def _checksum(rows):
+    return hashlib.sha256(json.dumps(rows, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _replace(conn, table, rows, source):
+    """
+    Swap in a new copy of a table. Returns True if its contents changed.
+    """
+    checksum = _checksum(rows)
+    now = time.time()
+    current = conn.execute(
+        'SELECT version, checksum FROM catalog_versions WHERE table_name = ?', (table,)
+    ).fetchone()
+
+    if current is not None and current['checksum'] == checksum:
+        conn.execute(
+            'UPDATE catalog_versions SET source = ?, synced_at = ?, last_error = NULL WHERE table_name = ?',
+            (source, now, table)
+        )
+        return False
+
+    conn.execute('DELETE FROM catalog_replica WHERE table_name = ?', (table,))
+    conn.executemany(
+        'INSERT OR REPLACE INTO catalog_replica (table_name, id, service_type, active, position, data) VALUES (?, ?, ?, ?, ?, ?)',
+        [
+            (
+                table, str(row.get('id', position)), row.get('service_type'),
+                1 if row.get('active', True) else 0, position, json.dumps(row, default=str)
+            )
+            for position, row in enumerate(rows)
+        ]
+    )
+    conn.execute(
+        '''INSERT INTO catalog_versions (table_name, version, checksum, source, row_count, synced_at)
+           VALUES (?, 1, ?, ?, ?, ?)
+           ON CONFLICT (table_name) DO UPDATE SET
+               version = version + 1, checksum = excluded.checksum, source = excluded.source,
+               row_count = excluded.row_count, synced_at = excluded.synced_at, last_error = NULL''',
+        (table, checksum, source, len(rows), now)
+    )
+    return True
+
+
+def _version(table):
+    """
+    The table's version row, seeding the table first if it has never been filled
+    """
+    ensure_schema(SCHEMA)
+    conn = get_connection()
+    row = conn.execute('SELECT * FROM catalog_versions WHERE table_name = ?', (table,)).fetchone()
+    if row is None:
+        with transaction() as conn:
+            if conn.execute('SELECT 1 FROM catalog_versions WHERE table_name = ?', (table,)).fetchone() is None:
+                _replace(conn, table, SEED_ROWS[table], 'seed')
+        row = conn.execute('SELECT * FROM catalog_versions WHERE table_name = ?', (table,)).fetchone()
+    return row
+
+
+def replica_rows(table, service_type=None, active=None):
+    """
+    Rows of a catalog table in service_type order, optionally only those for
+    one service and/or with the given active flag
+    """
+    version = _version(table)
+    _served_versions.setdefault(table, version['version'])
+    if version['source'] == 'seed':
+        record_fallback(table)
+
+    sql = 'SELECT data FROM catalog_replica WHERE table_name = ?'
+    params = [table]
+    if service_type is not None:
+        sql += ' AND service_type = ?'
+        params.append(service_type)
+    if active is not None:
+        sql += ' AND active = ?'
+        params.append(1 if active else 0)
+    sql += ' ORDER BY service_type, position'
+
+    return [json.loads(row['data']) for row in get_connection().execute(sql, params)]
+
+
+def sync_table(table):
+    """
+    Pull a table from Supabase into the replica. Returns True if it changed;
+    raises if Supabase couldn't be read.
+    """
+    supabase = get_supabase()
+    if not supabase or not upstream_available(table):
+        return False
+
+    rows = supabase.table(table).select('*').order('service_type').execute().data
+    _version(table)
+    with transaction() as conn:
+        changed = _replace(conn, table, rows, 'supabase')
+    if changed:
+        print(f"Catalog replica: {table} updated from Supabase ({len(rows)} rows)")
+    return changed
+
+
+def claim_sync(table, interval=REPLICA_SYNC_SECONDS):
+    """
+    True if this process should pull the table now; one process per interval does
+    """
+    _version(table)
+    now = time.time()
+    with transaction() as conn:
+        row = conn.execute(
+            'SELECT sync_started_at FROM catalog_versions WHERE table_name = ?', (table,)
+        ).fetchone()
+        if row['sync_started_at'] is not None and now - row['sync_started_at'] < interval:
+            return False
+        conn.execute('UPDATE catalog_versions SET sync_started_at = ? WHERE table_name = ?', (now, table))
+    return True
+
+
+def record_sync_error(table, error):
+    print(f"Catalog replica: syncing {table} failed: {error}")
+    with transaction() as conn:
+        conn.execute('UPDATE catalog_versions SET last_error = ? WHERE table_name = ?', (str(error), table))
+
+
+def refresh_cached_snapshots(table):
+    """
+    Drop this process's cached snapshots if the replica has moved on since
+    they were built
+    """
+    version = _version(table)['version']
+    served = _served_versions.get(table)
+    if served is not None and served != version:
+        catalog_cache.invalidate(table)
+        _served_versions[table] = version
+
+
+def sync_catalog():
+    for table in REPLICA_TABLES:
+        if claim_sync(table):
+            try:
+                sync_table(table)
+            except Exception as e:
+                record_sync_error(table, e)
+        refresh_cached_snapshots(table)
+    return False
+
+
+def replica_stats():
+    stats = {}
+    for table in REPLICA_TABLES:
+        row = _version(table)
+        stats[table] = {
+            'version': row['version'],
+            'source': row['source'],
+            'rows': row['row_count'],
+            'age_seconds': round(time.time() - row['synced_at'], 1),
+            'last_error': row['last_error']
+        }
+    return stats
+
+
+replica_worker = BackgroundWorker('catalog-replica', sync_catalog, interval=REPLICA_CHECK_SECONDS)
+
+
+def start_catalog_replica():
+    replica_worker.start()
@@ -0,0 +1,34 @@
+from src.services.allergen_index import ALLERGEN_FLAGS
+
+# The catalog as shipped. It seeds the local replica until the first sync
+# from Supabase, so the site can quote and show allergens offline. This is
+# the only copy of the fallback catalog; change it here.
+SEED_PRICES = [
+    {'id': '1', 'service_type': 'hog_roast', 'service_name': 'Hog Roast Catering', 'price_per_unit': 8.50, 'unit_type': 'person', 'minimum_quantity': 50, 'description': 'Traditional slow-cooked hog roast with all accompaniments', 'active': True},
+    {'id': '2', 'service_type': 'pizza', 'service_name': 'Mobile Pizza Van', 'price_per_unit': 12.00, 'unit_type': 'pizza', 'minimum_quantity': None, 'description': 'Wood-fired pizzas made fresh on-site', 'active': True},
+    {'id': '3', 'service_type': 'bar', 'service_name': 'Mobile Bar Service', 'price_per_unit': 300.00, 'unit_type': 'event', 'minimum_quantity': None, 'description': 'Professional licensed mobile bar with bartender', 'active': True},
+    {'id': '4', 'service_type': 'buffet', 'service_name': 'Buffet Package 1', 'price_per_unit': 6.50, 'unit_type': 'person', 'minimum_quantity': 20, 'description': 'Basic buffet package', 'active': True},
+    {'id': '5', 'service_type': 'buffet', 'service_name': 'Buffet Package 2', 'price_per_unit': 8.50, 'unit_type': 'person', 'minimum_quantity': 20, 'description': 'Standard buffet package', 'active': True},
+    {'id': '6', 'service_type': 'buffet', 'service_name': 'Buffet Package 3', 'price_per_unit': 12.50, 'unit_type': 'person', 'minimum_quantity': 20, 'description': 'Premium buffet package', 'active': True}
+]
+
+
+def _allergen(id, service_type, item_name, *flags):
+    row = {'id': id, 'service_type': service_type, 'item_name': item_name}
+    row.update({flag: flag in flags for flag in ALLERGEN_FLAGS})
+    return row
+
+
+SEED_ALLERGENS = [
+    _allergen('1', 'hog_roast', 'Roasted Pork'),
+    _allergen('2', 'hog_roast', 'Bread Rolls', 'contains_gluten', 'vegetarian'),
+    _allergen('3', 'hog_roast', 'Apple Sauce', 'vegetarian', 'vegan'),
+    _allergen('4', 'pizza', 'Pizza Base', 'contains_gluten', 'vegetarian'),
+    _allergen('5', 'pizza', 'Mozzarella Cheese', 'contains_dairy', 'vegetarian'),
+    _allergen('6', 'buffet', 'Mixed Sandwiches', 'contains_gluten', 'contains_dairy', 'vegetarian')
+]
+
+SEED_ROWS = {
+    'prices': SEED_PRICES,
+    'allergens': SEED_ALLERGENS
+}
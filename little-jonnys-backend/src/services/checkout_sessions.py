@@ -0,0 +1,86 @@
+import json
+import time
+import uuid
+import hashlib
+from src.services.local_db import ensure_schema, get_connection
+
+# Checkout sessions we've created, so a customer who clicks pay again gets
+# the session they already have instead of a new Stripe round-trip
+REUSE_MARGIN_SECONDS = 15 * 60
+RETENTION_SECONDS = 30 * 24 * 3600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS checkout_sessions (
+    session_id TEXT PRIMARY KEY,
+    booking_id TEXT NOT NULL,
+    amount_pence INTEGER NOT NULL,
+    url TEXT,
+    status TEXT NOT NULL DEFAULT 'open',
+    expires_at REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_checkout_sessions_booking ON checkout_sessions (booking_id, amount_pence, status);
+'''
+
+
+def find_open_session(booking_id, amount_pence):
+    """
+    Return the newest open session for this booking and amount that won't
+    expire while the customer is paying, or None
+    """
+    ensure_schema(SCHEMA)
+    return get_connection().execute(
+        '''SELECT session_id, url, expires_at FROM checkout_sessions
+           WHERE booking_id = ? AND amount_pence = ? AND status = 'open' AND expires_at > ?
+           ORDER BY created_at DESC LIMIT 1''',
+        (str(booking_id), amount_pence, time.time() + REUSE_MARGIN_SECONDS)
+    ).fetchone()
+
+
+def idempotency_key(booking_id, amount_pence, params, fresh=False):
+    """
+    Stripe idempotency key for the next session of this booking and amount.
+
+    Concurrent clicks with the same details share a key, so Stripe hands them
+    the same session; changed details (e.g. another email) get their own key
+    rather than an idempotency error. The key moves on once earlier sessions
+    are closed, otherwise Stripe would replay a session that has since
+    expired. A fresh key is for when the shared one stays stuck.
+    """
+    ensure_schema(SCHEMA)
+    row = get_connection().execute(
+        'SELECT COUNT(*) AS count FROM checkout_sessions WHERE booking_id = ? AND amount_pence = ?',
+        (str(booking_id), amount_pence)
+    ).fetchone()
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+    key = f'checkout-{booking_id}-{amount_pence}-{row["count"]}-{digest}'
+    return f'{key}-{uuid.uuid4().hex[:8]}' if fresh else key
+
+
+def record_session(booking_id, amount_pence, session):
+    ensure_schema(SCHEMA)
+    now = time.time()
+    conn = get_connection()
+    # An idempotent replay returns a session we may already have stored
+    conn.execute(
+        '''INSERT OR IGNORE INTO checkout_sessions
+           (session_id, booking_id, amount_pence, url, status, expires_at, created_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+        (session.id, str(booking_id), amount_pence, session.url, session.status or 'open',
+         session.expires_at or now + 24 * 3600, now)
+    )
+    conn.execute(
+        "DELETE FROM checkout_sessions WHERE status != 'open' AND created_at < ?",
+        (now - RETENTION_SECONDS,)
+    )
+
+
+def mark_session(session_id, status):
+    """
+    Record that a session was completed or expired so it is not handed out again
+    """
+    ensure_schema(SCHEMA)
+    get_connection().execute(
+        'UPDATE checkout_sessions SET status = ? WHERE session_id = ?',
+        (status, session_id)
+    )
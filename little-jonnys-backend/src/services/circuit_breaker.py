@@ -0,0 +1,160 @@
+import os
+import re
+import time
+import threading
+from collections import deque
+import httpx
+
+# Per-table circuit breakers for Supabase. A table's breaker opens when too
+# many recent calls failed or were slow; while open, calls fail at once
+# instead of tying up a worker thread for the whole timeout. After a pause
+# one probe call is let through, and its outcome closes or reopens it.
+BREAKER_WINDOW = int(os.getenv('BREAKER_WINDOW', '20'))
+BREAKER_MIN_CALLS = int(os.getenv('BREAKER_MIN_CALLS', '5'))
+BREAKER_FAILURE_RATIO = float(os.getenv('BREAKER_FAILURE_RATIO', '0.5'))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv('BREAKER_SLOW_CALL_SECONDS', '2'))
+BREAKER_OPEN_SECONDS = float(os.getenv('BREAKER_OPEN_SECONDS', '30'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling Supabase while a table's breaker is open
+    """
+
+    def __init__(self, name, retry_after):
+        super().__init__(f'Supabase {name} is unavailable, retry in {retry_after:.0f}s')
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=BREAKER_WINDOW)
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        if self.state == CLOSED:
+            return 0
+        return max(0.0, self._opened_at + BREAKER_OPEN_SECONDS - time.monotonic())
+
+    def available(self):
+        """
+        True if a call would be let through right now. Doesn't claim the
+        half-open probe, so it is safe for deciding whether to try at all.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return self.retry_after() == 0
+            return not self._probing
+
+    def before_call(self):
+        """
+        Claim permission for one call, raising CircuitOpenError if there is none
+        """
+        with self._lock:
+            if self.state == OPEN and self.retry_after() == 0:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            raise CircuitOpenError(self.name, max(1.0, self.retry_after()))
+
+    def after_call(self, seconds, failed):
+        failed = failed or seconds >= BREAKER_SLOW_CALL_SECONDS
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._open()
+                else:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                return
+
+            self._outcomes.append(failed)
+            failures = sum(self._outcomes)
+            if (
+                self.state == CLOSED
+                and len(self._outcomes) >= BREAKER_MIN_CALLS
+                and failures / len(self._outcomes) >= BREAKER_FAILURE_RATIO
+            ):
+                self._open()
+
+    def _open(self):
+        print(f"Circuit breaker for Supabase {self.name} opened")
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'recent_failures': sum(self._outcomes),
+                'recent_calls': len(self._outcomes),
+                'retry_after': round(self.retry_after(), 1)
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(table):
+    breaker = _breakers.get(table)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(table, CircuitBreaker(table))
+    return breaker
+
+
+def upstream_available(table):
+    """
+    False while the table's breaker is refusing calls
+    """
+    return breaker_for(table).available()
+
+
+def breaker_stats():
+    return {name: breaker.stats() for name, breaker in sorted(_breakers.items())}
+
+
+_SUPABASE_TABLE = re.compile(r'^/rest/v1/([^/?]+)')
+
+
+class CircuitBreakerTransport(httpx.BaseTransport):
+    """
+    Guards each PostgREST table with its own breaker
+    """
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    def handle_request(self, request):
+        match = _SUPABASE_TABLE.match(request.url.path)
+        breaker = breaker_for(match.group(1) if match else request.url.path)
+        breaker.before_call()
+        start = time.monotonic()
+        try:
+            response = self._transport.handle_request(request)
+        except Exception:
+            breaker.after_call(time.monotonic() - start, failed=True)
+            raise
+        breaker.after_call(time.monotonic() - start, response.status_code >= 500)
+        return response
+
+    def close(self):
+        self._transport.close()
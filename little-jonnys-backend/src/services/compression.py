@@ -0,0 +1,117 @@
+import os
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# API responses at least this big are compressed for clients that accept it
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+
+COMPRESSIBLE_MIMETYPES = (
+    'application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html'
+)
+
+# Per-request compression favours speed; bodies that are built once and
+# reused (catalog responses) are worth the slowest, smallest settings
+FAST_LEVELS = {'br': 4, 'gzip': 6}
+BEST_LEVELS = {'br': 11, 'gzip': 9}
+
+# Encodings this install can produce, most preferred first
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def accepted_encodings():
+    """
+    Parse Accept-Encoding into {encoding: q}
+    """
+    accepted = {}
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.lower()] = q
+    return accepted
+
+
+def choose_encoding(available=None):
+    """
+    The best encoding the client accepts, preferring brotli, or 'identity'
+    """
+    accepted = accepted_encodings()
+    for encoding in ENCODINGS:
+        if available is not None and encoding not in available:
+            continue
+        if accepted.get(encoding, 0) > 0:
+            return encoding
+    return 'identity'
+
+
+def compress(data, encoding, best=False):
+    level = (BEST_LEVELS if best else FAST_LEVELS)[encoding]
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def encoded_etag(etag, encoding):
+    """
+    A distinct strong ETag per encoding, e.g. "abc" -> "abc-br"
+    """
+    if encoding == 'identity' or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def etag_matches(etag, header):
+    """
+    True if an If-None-Match header names this ETag in any encoding
+    """
+    if not header:
+        return False
+    candidates = [tag.strip().removeprefix('W/') for tag in header.split(',')]
+    if '*' in candidates:
+        return True
+    return any(encoded_etag(etag, encoding) in candidates for encoding in ('identity', 'br', 'gzip'))
+
+
+def init_app(app):
+    """
+    Compress large text responses from every blueprint according to Accept-Encoding
+    """
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or not 200 <= response.status_code < 300
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        ):
+            return response
+
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding()
+        if encoding == 'identity':
+            return response
+
+        compressed = compress(data, encoding)
+        if len(compressed) >= len(data):
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        if response.headers.get('ETag'):
+            response.headers['ETag'] = encoded_etag(response.headers['ETag'], encoding)
+        return response
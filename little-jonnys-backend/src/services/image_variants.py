@@ -0,0 +1,201 @@
+import io
+import os
+import hashlib
+import threading
+from flask import Response, request
+from src.services.compression import etag_matches
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+    features = None
+
+# Resized and re-encoded photos are written here once and reused
+IMAGE_CACHE_DIR = os.getenv(
+    'IMAGE_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'images')
+)
+
+# Widths offered to ?w= requests; a request is rounded up to the next one
+IMAGE_WIDTHS = (480, 768, 1280, 1920)
+
+RESIZABLE_TYPES = ('image/jpeg', 'image/png')
+
+# Output format -> (Pillow format, mimetype, save options)
+OUTPUT_FORMATS = {
+    'avif': ('AVIF', 'image/avif', {'quality': 50}),
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', 'image/png', {'optimize': True})
+}
+
+
+def _supported(fmt):
+    if Image is None:
+        return False
+    if fmt in ('avif', 'webp'):
+        return features.check(fmt)
+    return True
+
+
+class ImageVariants:
+    """
+    Generates width/format variants of static photos on first use and keeps
+    them in memory and on disk
+    """
+
+    def __init__(self):
+        self._variants = {}
+        self._sizes = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def original_width(self, static_file):
+        width = self._sizes.get(static_file.digest)
+        if width is None:
+            with Image.open(io.BytesIO(static_file.variants['identity'])) as image:
+                width = image.width
+            self._sizes[static_file.digest] = width
+        return width
+
+    def get(self, static_file, width, fmt):
+        """
+        Return (encoded bytes, ETag) for one variant, generating it if needed
+        """
+        key = (static_file.digest, width, fmt)
+        variant = self._variants.get(key)
+        if variant is not None:
+            return variant
+
+        with self._key_lock(key):
+            variant = self._variants.get(key)
+            if variant is None:
+                data = self._load_or_generate(static_file, width, fmt)
+                variant = (data, '"' + hashlib.sha256(data).hexdigest()[:20] + '"')
+                self._variants[key] = variant
+        return variant
+
+    def _load_or_generate(self, static_file, width, fmt):
+        cache_path = os.path.join(IMAGE_CACHE_DIR, f'{static_file.digest}-{width}.{fmt}')
+        try:
+            with open(cache_path, 'rb') as f:
+                return f.read()
+        except OSError:
+            pass
+
+        pil_format, _, options = OUTPUT_FORMATS[fmt]
+        with Image.open(io.BytesIO(static_file.variants['identity'])) as image:
+            if image.width > width:
+                height = round(image.height * width / image.width)
+                image = image.resize((width, height), Image.LANCZOS)
+            if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, pil_format, **options)
+        data = buffer.getvalue()
+
+        try:
+            os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+            tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Could not cache image variant {cache_path}: {e}")
+
+        return data
+
+    def pregenerate(self, static_index):
+        """
+        Build every variant of every static photo, e.g. at deploy time
+        """
+        count = 0
+        for static_file in static_index.files.values():
+            if static_file.mimetype not in RESIZABLE_TYPES:
+                continue
+            original = self.original_width(static_file)
+            widths = [w for w in IMAGE_WIDTHS if w < original] + [original]
+            formats = [f for f in ('avif', 'webp') if _supported(f)] + [_original_format(static_file)]
+            for width in widths:
+                for fmt in formats:
+                    if width == original and fmt == _original_format(static_file):
+                        continue
+                    self.get(static_file, width, fmt)
+                    count += 1
+        return count
+
+
+image_variants = ImageVariants()
+
+
+def _original_format(static_file):
+    return 'png' if static_file.mimetype == 'image/png' else 'jpeg'
+
+
+def _choose_format(static_file):
+    original = _original_format(static_file)
+    accept = request.accept_mimetypes
+    # Newer formats only when named outright (image/* or */* doesn't mean
+    # the browser can decode AVIF), weighed by their q values; on a tie
+    # the smaller format wins
+    listed = {value.lower(): quality for value, quality in accept}
+    candidates = [(listed.get(f'image/{fmt}', 0), fmt) for fmt in ('avif', 'webp') if _supported(fmt)]
+    candidates.append((accept[f'image/{original}'], original))
+    quality, fmt = max(candidates, key=lambda candidate: candidate[0])
+    return fmt if quality > 0 else original
+
+
+def _choose_width(static_file):
+    original = image_variants.original_width(static_file)
+    try:
+        requested = int(request.args.get('w', ''))
+    except ValueError:
+        return original
+    for width in IMAGE_WIDTHS:
+        if width >= requested:
+            return min(width, original)
+    return original
+
+
+def is_resizable(static_file):
+    return Image is not None and static_file.mimetype in RESIZABLE_TYPES
+
+
+def image_response(static_file):
+    """
+    Serve a photo in the best format the browser accepts, at the ?w= width
+    """
+    width = _choose_width(static_file)
+    fmt = _choose_format(static_file)
+    original = width == image_variants.original_width(static_file)
+
+    if original and fmt == _original_format(static_file):
+        # Nothing to transform, the untouched upload is the best we have
+        data, etag = static_file.variants['identity'], static_file.etag('identity')
+    else:
+        data, etag = image_variants.get(static_file, width, fmt)
+
+    headers = {
+        'ETag': etag,
+        'Cache-Control': static_file.cache_control,
+        'Vary': 'Accept'
+    }
+
+    if etag_matches(etag, request.headers.get('If-None-Match')):
+        return Response(status=304, headers=headers)
+
+    return Response(data, mimetype=OUTPUT_FORMATS[fmt][1], headers=headers)
+
+
+if __name__ == '__main__':
+    # python -m src.services.image_variants
+    from src.services.static_files import StaticIndex
+
+    static_root = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static')
+    generated = image_variants.pregenerate(StaticIndex(static_root))
+    print(f"Generated {generated} image variants in {IMAGE_CACHE_DIR}")
@@ -0,0 +1,50 @@
+import importlib
+import threading
+
+
+class LazyModule:
+    """
+    Stands in for a module that is slow to import. The real module is
+    imported, and passed to on_load, the first time an attribute is used.
+    """
+
+    def __init__(self, name, on_load=None):
+        self._name = name
+        self._on_load = on_load
+        self._module = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    module = importlib.import_module(self._name)
+                    if self._on_load is not None:
+                        self._on_load(module)
+                    self._module = module
+        return self._module
+
+    def preload(self):
+        """
+        Import the module on a background thread so the first request that
+        needs it doesn't wait, without holding up startup
+        """
+        if self._module is None:
+            threading.Thread(target=self._preload, name=f'import-{self._name}', daemon=True).start()
+
+    def _preload(self):
+        try:
+            self.load()
+        except Exception as e:
+            print(f"Failed to import {self._name}: {e}")
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
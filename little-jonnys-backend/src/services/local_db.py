@@ -0,0 +1,64 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Local SQLite store for state that must survive restarts and must not wait
+# on Supabase (queues, outboxes, registries). It holds customer details, so
+# it lives outside the source tree's tracked files.
+LOCAL_DB_PATH = os.getenv(
+    'LOCAL_DB_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'var', 'app.db')
+)
+
+_local = threading.local()
+_schemas = set()
+_schema_lock = threading.Lock()
+
+
+def get_connection():
+    """
+    Return this thread's connection to the local database
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+
+    os.makedirs(os.path.dirname(LOCAL_DB_PATH) or '.', exist_ok=True)
+    conn = sqlite3.connect(LOCAL_DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=30000')
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+def ensure_schema(sql):
+    """
+    Create tables and indexes once per process
+    """
+    if sql in _schemas:
+        return
+    with _schema_lock:
+        if sql not in _schemas:
+            get_connection().executescript(sql)
+            _schemas.add(sql)
+
+
+@contextmanager
+def transaction():
+    """
+    Run statements in one write transaction, taking the write lock up front
+    so concurrent workers don't claim the same rows
+    """
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    else:
+        conn.execute('COMMIT')
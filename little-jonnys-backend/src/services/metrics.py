@@ -0,0 +1,228 @@
+import re
+import time
+import bisect
+import threading
+import httpx
+from flask import Response, g, request
+
+# In-process request and upstream metrics, exposed in Prometheus text format.
+# Each worker process keeps its own counts.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = [
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    ]
+    return '{' + ','.join(escaped) + '}'
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), state[:-1]):
+                cumulative += count
+                le = ('le', bound if bound == '+Inf' else repr(float(bound)))
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {state[-1]:.6f}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """
+    Values read when metrics are scraped, from a collector function that
+    returns {labels: value}
+    """
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.collector = None
+
+    def collect_with(self, fn):
+        self.collector = fn
+        return fn
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge']
+        if self.collector is None:
+            return lines
+        try:
+            items = sorted(self.collector().items())
+        except Exception as e:
+            print(f"Collecting {self.name} failed: {e}")
+            return lines
+        for labels, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time spent handling requests',
+    ('blueprint', 'endpoint', 'method')
+)
+REQUESTS = Counter(
+    'http_requests_total', 'Requests handled, by response status',
+    ('blueprint', 'endpoint', 'method', 'status')
+)
+REQUEST_ERRORS = Counter(
+    'http_request_errors_total', 'Requests that ended in a server error',
+    ('blueprint', 'endpoint')
+)
+UPSTREAM_LATENCY = Histogram(
+    'upstream_request_duration_seconds', 'Time spent waiting on Supabase and Stripe',
+    ('upstream', 'operation', 'method')
+)
+UPSTREAM_ERRORS = Counter(
+    'upstream_errors_total', 'Upstream calls that failed or returned a server error',
+    ('upstream', 'operation')
+)
+FALLBACK_HITS = Counter(
+    'fallback_responses_total', 'Responses served from built-in fallback data',
+    ('source',)
+)
+COALESCED_REQUESTS = Counter(
+    'coalesced_requests_total', 'Reads that shared another caller\'s in-flight upstream request',
+    ('group',)
+)
+
+OUTBOX_ROWS = Gauge(
+    'booking_outbox_rows', 'Bookings and booking edits held in the local outbox, by status',
+    ('queue', 'status')
+)
+
+REGISTRY = [
+    REQUEST_LATENCY, REQUESTS, REQUEST_ERRORS, UPSTREAM_LATENCY, UPSTREAM_ERRORS, FALLBACK_HITS,
+    COALESCED_REQUESTS, OUTBOX_ROWS
+]
+
+
+def record_fallback(source):
+    FALLBACK_HITS.inc(source)
+
+
+def record_upstream(upstream, operation, method, seconds, failed=False):
+    UPSTREAM_LATENCY.observe(seconds, upstream, operation, method)
+    if failed:
+        UPSTREAM_ERRORS.inc(upstream, operation)
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+_SUPABASE_TABLE = re.compile(r'^/rest/v1/([^/?]+)')
+
+
+class InstrumentedTransport(httpx.BaseTransport):
+    """
+    Wraps the Supabase connection pool and times every PostgREST call by table
+    """
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    def handle_request(self, request):
+        match = _SUPABASE_TABLE.match(request.url.path)
+        operation = match.group(1) if match else request.url.path
+        start = time.perf_counter()
+        try:
+            response = self._transport.handle_request(request)
+        except Exception:
+            record_upstream('supabase', operation, request.method, time.perf_counter() - start, failed=True)
+            raise
+        record_upstream('supabase', operation, request.method, time.perf_counter() - start, response.status_code >= 500)
+        return response
+
+    def close(self):
+        self._transport.close()
+
+
+def _request_labels():
+    return (request.blueprint or '', request.endpoint or 'unmatched', request.method)
+
+
+def init_app(app):
+    """
+    Time every request and expose the metrics on /metrics
+    """
+    @app.before_request
+    def start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            blueprint, endpoint, method = _request_labels()
+            REQUEST_LATENCY.observe(time.perf_counter() - start, blueprint, endpoint, method)
+            REQUESTS.inc(blueprint, endpoint, method, str(response.status_code))
+            if response.status_code >= 500:
+                REQUEST_ERRORS.inc(blueprint, endpoint)
+        return response
+
+    @app.teardown_request
+    def record_exception(exc):
+        # Unhandled exceptions skip after_request
+        if exc is not None and g.pop('_metrics_start', None) is not None:
+            blueprint, endpoint, method = _request_labels()
+            REQUESTS.inc(blueprint, endpoint, method, '500')
+            REQUEST_ERRORS.inc(blueprint, endpoint)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,63 @@
+import os
+import time
+from src.services.local_db import ensure_schema, get_connection
+
+# Payment outcome per Checkout session, written as soon as a webhook is
+# verified so the success redirect doesn't have to ask Stripe
+PAYMENT_WAIT_SECONDS = float(os.getenv('PAYMENT_WAIT_SECONDS', '2'))
+POLL_INTERVAL_SECONDS = 0.05
+RETENTION_SECONDS = 30 * 24 * 3600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS payment_state (
+    session_id TEXT PRIMARY KEY,
+    booking_id TEXT,
+    payment_status TEXT NOT NULL,
+    amount_total INTEGER,
+    updated_at REAL NOT NULL
+);
+'''
+
+
+def record_payment(session):
+    """
+    Store the payment state of a Checkout session from a webhook or a Stripe lookup
+    """
+    ensure_schema(SCHEMA)
+    now = time.time()
+    metadata = session.get('metadata') or {}
+    conn = get_connection()
+    conn.execute(
+        '''INSERT INTO payment_state (session_id, booking_id, payment_status, amount_total, updated_at)
+           VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT (session_id) DO UPDATE SET
+               payment_status = excluded.payment_status,
+               amount_total = excluded.amount_total,
+               updated_at = excluded.updated_at''',
+        (session['id'], metadata.get('booking_id'), session.get('payment_status') or 'unpaid',
+         session.get('amount_total'), now)
+    )
+    conn.execute('DELETE FROM payment_state WHERE updated_at < ?', (now - RETENTION_SECONDS,))
+
+
+def get_payment(session_id):
+    ensure_schema(SCHEMA)
+    return get_connection().execute(
+        'SELECT session_id, booking_id, payment_status, amount_total FROM payment_state WHERE session_id = ?',
+        (session_id,)
+    ).fetchone()
+
+
+def wait_for_payment(session_id, timeout=PAYMENT_WAIT_SECONDS):
+    """
+    Return the stored state once it shows the session paid, waiting up to
+    timeout seconds for the webhook. Returns None if it never does.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        state = get_payment(session_id)
+        if state is not None and state['payment_status'] == 'paid':
+            return state
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(POLL_INTERVAL_SECONDS)
@@ -0,0 +1,158 @@
+import re
+
+# Business rules that are not stored in the prices table
+PIZZAS_PER_GUEST = 1.5
+DEPOSIT_RATE = 0.2
+MINIMUM_DEPOSIT = 500
+
+# Booking form service key -> (prices.service_type, guest count field)
+QUOTE_SERVICES = [
+    ('hogRoast', 'hog_roast', 'hogRoastGuests'),
+    ('pizza', 'pizza', 'pizzaGuests'),
+    ('bar', 'bar', None),
+    ('buffet', 'buffet', 'buffetGuests')
+]
+
+_PACKAGE_NUMBER = re.compile(r'package\s*(\d+)', re.IGNORECASE)
+
+
+class QuoteInputError(ValueError):
+    """
+    Raised when a scenario has a value that can't be priced
+    """
+
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+
+
+class _PricedService:
+    def __init__(self, row):
+        self.name = row['service_name']
+        self.unit = row['unit_type']
+        self.price = float(row['price_per_unit'])
+
+    def quantities(self, guests):
+        """
+        Billable quantity for each guest count, per the row's unit type
+        """
+        if self.unit == 'event':
+            return [1] * len(guests)
+        if self.unit == 'pizza':
+            return [max(1, int(g * PIZZAS_PER_GUEST)) for g in guests]
+        return guests
+
+
+class PricingPlan:
+    """
+    Active price rows compiled into per-service unit prices, ready to quote
+    many scenarios without re-reading the table
+    """
+
+    def __init__(self, rows):
+        self.services = {}
+        self.buffet_packages = {}
+
+        for row in rows:
+            if row['service_type'] == 'buffet':
+                match = _PACKAGE_NUMBER.search(row.get('service_name') or '')
+                if match:
+                    self.buffet_packages[f'package{match.group(1)}'] = _PricedService(row)
+            elif row['service_type'] not in self.services:
+                self.services[row['service_type']] = _PricedService(row)
+
+        # Unknown package names are priced as the first package
+        self.default_package = min(self.buffet_packages, key=lambda p: int(p[len('package'):]), default=None)
+
+    def _guest_column(self, scenarios, indexes, field):
+        guests = []
+        for i in indexes:
+            try:
+                guests.append(int(scenarios[i][field]))
+            except (TypeError, ValueError):
+                raise QuoteInputError(i, f'Invalid {field}: {scenarios[i][field]!r}')
+        return guests
+
+    def _selected(self, scenarios, service_key, guest_field):
+        return [
+            i for i, data in enumerate(scenarios)
+            if (data.get('services') or {}).get(service_key)
+            and (guest_field is None or data.get(guest_field))
+        ]
+
+    def quote_many(self, scenarios):
+        """
+        Price a list of quote requests, working one service column at a time
+        across all scenarios
+        """
+        breakdowns = [[] for _ in scenarios]
+        totals = [0] * len(scenarios)
+
+        for service_key, service_type, guest_field in QUOTE_SERVICES:
+            indexes = self._selected(scenarios, service_key, guest_field)
+            if not indexes:
+                continue
+
+            if service_type == 'buffet':
+                self._quote_buffet(scenarios, indexes, breakdowns, totals)
+                continue
+
+            priced = self.services.get(service_type)
+            if priced is None:
+                continue
+
+            guests = self._guest_column(scenarios, indexes, guest_field) if guest_field else [None] * len(indexes)
+            quantities = priced.quantities(guests)
+            service_totals = [q * priced.price for q in quantities]
+
+            for i, guest_count, quantity, service_total in zip(indexes, guests, quantities, service_totals):
+                totals[i] += service_total
+                item = {
+                    'service': priced.name,
+                    'quantity': quantity,
+                    'unit': priced.unit,
+                    'price_per_unit': priced.price,
+                    'total': service_total
+                }
+                if priced.unit == 'pizza':
+                    item['note'] = f'Estimated {quantity} pizzas for {guest_count} guests'
+                breakdowns[i].append(item)
+
+        return [
+            {
+                'total_quote': round(total, 2),
+                'deposit_amount': round(max(MINIMUM_DEPOSIT, total * DEPOSIT_RATE), 2),
+                'breakdown': breakdown,
+                'currency': 'GBP'
+            }
+            for total, breakdown in zip(totals, breakdowns)
+        ]
+
+    def _quote_buffet(self, scenarios, indexes, breakdowns, totals):
+        if self.default_package is None:
+            return
+
+        guests = self._guest_column(scenarios, indexes, 'buffetGuests')
+        for i, guest_count in zip(indexes, guests):
+            package = scenarios[i].get('buffetPackage', 'package1')
+            priced = self.buffet_packages.get(package, self.buffet_packages[self.default_package])
+            service_total = guest_count * priced.price
+            totals[i] += service_total
+            breakdowns[i].append({
+                'service': f'Buffet Catering ({package.replace("package", "Package ")})',
+                'quantity': guest_count,
+                'unit': priced.unit,
+                'price_per_unit': priced.price,
+                'total': service_total
+            })
+
+    def quote(self, data):
+        return self.quote_many([data])[0]
+
+
+def pricing_plan(snapshot):
+    """
+    Return the pricing plan for a catalog snapshot of active price rows,
+    compiled once and replaced whenever the snapshot is
+    """
+    return snapshot.derive('pricing_plan', PricingPlan)
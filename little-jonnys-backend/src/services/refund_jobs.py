@@ -0,0 +1,370 @@
+import os
+import json
+import time
+import hashlib
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from src.config.supabase import get_supabase
+from src.config.stripe_client import stripe
+from src.services.background import BackgroundWorker
+from src.services.booking_events import publish
+from src.services.booking_outbox import queue_booking_update
+from src.services.circuit_breaker import CircuitOpenError, upstream_available
+from src.services.local_db import ensure_schema, get_connection, transaction
+
+# Batch refunds (e.g. every deposit for a cancelled event day) run as a
+# job: each item's Stripe calls go through a small shared thread pool, and
+# progress is kept in the local database so any worker can report it.
+# The running process renews the job's lease as it goes; a job whose
+# process has died or stopped renewing is picked up by another process,
+# which refunds the items still pending. Each batch has a key (the
+# client's, or one derived from its refunds), so submitting the same batch
+# again returns the existing job instead of refunding twice.
+REFUND_WORKERS = int(os.getenv('REFUND_WORKERS', '8'))
+REFUND_LEASE_SECONDS = 120
+LEASE_RENEW_SECONDS = 30
+MAX_BATCH_REFUNDS = 200
+REFUNDED_STATUS = 'refunded'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS refund_jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'running',
+    reason TEXT NOT NULL,
+    bookings_updated INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    owner_pid INTEGER,
+    locked_at REAL,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS refund_items (
+    job_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    session_id TEXT NOT NULL,
+    amount_pence INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending',
+    booking_id TEXT,
+    paid_pence INTEGER,
+    refund_id TEXT,
+    refunded_pence INTEGER,
+    full_refund INTEGER,
+    refund_status TEXT,
+    error TEXT,
+    finished_at REAL,
+    PRIMARY KEY (job_id, position)
+);
+CREATE TABLE IF NOT EXISTS refund_batches (
+    batch_key TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL UNIQUE,
+    items_hash TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+'''
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+# Jobs this process is running
+_active_jobs = set()
+_active_lock = threading.Lock()
+
+
+def _pool():
+    # Pool threads don't survive a fork, so each worker process makes its own
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=REFUND_WORKERS, thread_name_prefix='refund')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+class RefundBatchConflict(Exception):
+    """
+    A batch key was reused with different refunds
+    """
+
+
+def refund_idempotency_key(batch_key, session_id, amount_pence):
+    """
+    One key per batch and session, so retrying an item or resubmitting its
+    batch replays the refund rather than making another, while a batch with
+    a new key can refund the same session again (e.g. a second partial
+    refund). Stripe itself refuses refunds beyond what was paid.
+    """
+    amount = 'full' if amount_pence is None else amount_pence
+    return f'refund-{batch_key}-{session_id}-{amount}'
+
+
+def _items_hash(items, reason):
+    refunds = sorted([item['session_id'], item['amount_pence']] for item in items)
+    return hashlib.sha256(json.dumps([refunds, reason]).encode('utf-8')).hexdigest()
+
+
+def start_refund_job(items, reason, batch_key=None):
+    """
+    Record a batch of {'session_id', 'amount_pence'} items and start
+    refunding them in the background. Without a batch key one is derived
+    from the refunds. Returns (job id, False) if the batch was already
+    submitted, or (job id, True) for a new job. Raises RefundBatchConflict
+    if the key was used for different refunds.
+    """
+    ensure_schema(SCHEMA)
+    items_hash = _items_hash(items, reason)
+    batch_key = batch_key or f'auto-{items_hash[:32]}'
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with transaction() as conn:
+        existing = conn.execute(
+            'SELECT job_id, items_hash FROM refund_batches WHERE batch_key = ?', (batch_key,)
+        ).fetchone()
+        if existing is not None:
+            if existing['items_hash'] != items_hash:
+                raise RefundBatchConflict('idempotency_key was already used for different refunds')
+            return existing['job_id'], False
+
+        conn.execute(
+            'INSERT INTO refund_batches (batch_key, job_id, items_hash, created_at) VALUES (?, ?, ?, ?)',
+            (batch_key, job_id, items_hash, now)
+        )
+        conn.execute(
+            'INSERT INTO refund_jobs (id, reason, owner_pid, locked_at, created_at) VALUES (?, ?, ?, ?, ?)',
+            (job_id, reason, os.getpid(), now, now)
+        )
+        conn.executemany(
+            'INSERT INTO refund_items (job_id, position, session_id, amount_pence) VALUES (?, ?, ?, ?)',
+            [(job_id, position, item['session_id'], item['amount_pence']) for position, item in enumerate(items)]
+        )
+
+    _start_job(job_id)
+    return job_id, True
+
+
+def _start_job(job_id):
+    with _active_lock:
+        _active_jobs.add(job_id)
+    threading.Thread(target=_run_job, args=(job_id,), name=f'refund-job-{job_id[:8]}', daemon=True).start()
+
+
+def _run_job(job_id):
+    try:
+        conn = get_connection()
+        reason = conn.execute('SELECT reason FROM refund_jobs WHERE id = ?', (job_id,)).fetchone()['reason']
+        batch = conn.execute('SELECT batch_key FROM refund_batches WHERE job_id = ?', (job_id,)).fetchone()
+        batch_key = batch['batch_key'] if batch else job_id
+        items = conn.execute(
+            "SELECT position, session_id, amount_pence FROM refund_items WHERE job_id = ? AND status = 'pending' ORDER BY position",
+            (job_id,)
+        ).fetchall()
+
+        pool = _pool()
+        futures = [pool.submit(_refund_item, job_id, batch_key, item['position'], dict(item), reason) for item in items]
+        while wait(futures, timeout=LEASE_RENEW_SECONDS).not_done:
+            _renew_lease(job_id)
+
+        error = None
+        updated = 0
+        try:
+            updated = _update_bookings(job_id)
+        except Exception as e:
+            error = f'Refunds were made but bookings were not updated: {e}'
+            print(f"Refund job {job_id}: {error}")
+
+        with transaction() as conn:
+            conn.execute(
+                'UPDATE refund_jobs SET status = ?, bookings_updated = ?, error = ?, finished_at = ? WHERE id = ?',
+                ('completed' if error is None else 'failed', updated, error, time.time(), job_id)
+            )
+    finally:
+        with _active_lock:
+            _active_jobs.discard(job_id)
+
+
+def _renew_lease(job_id):
+    get_connection().execute(
+        'UPDATE refund_jobs SET locked_at = ? WHERE id = ? AND owner_pid = ?',
+        (time.time(), job_id, os.getpid())
+    )
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _abandoned(job, now):
+    if job['owner_pid'] == os.getpid():
+        # A restarted worker can be given its predecessor's pid
+        with _active_lock:
+            return job['id'] not in _active_jobs
+    if job['owner_pid'] is None or job['locked_at'] is None:
+        return True
+    return now - job['locked_at'] > REFUND_LEASE_SECONDS or not _process_alive(job['owner_pid'])
+
+
+def _claim_abandoned_job():
+    now = time.time()
+    with transaction() as conn:
+        jobs = conn.execute(
+            "SELECT id, owner_pid, locked_at FROM refund_jobs WHERE status = 'running' ORDER BY created_at"
+        ).fetchall()
+        for job in jobs:
+            if _abandoned(job, now):
+                conn.execute(
+                    'UPDATE refund_jobs SET owner_pid = ?, locked_at = ? WHERE id = ?',
+                    (os.getpid(), now, job['id'])
+                )
+                return job['id']
+    return None
+
+
+def resume_refund_jobs():
+    """
+    Take over one job left running by a process that died or hung. Returns
+    True if a job was resumed.
+    """
+    ensure_schema(SCHEMA)
+    job_id = _claim_abandoned_job()
+    if job_id is None:
+        return False
+    print(f"Refund job {job_id}: resuming after its worker stopped")
+    _start_job(job_id)
+    return True
+
+
+def _refund_item(job_id, batch_key, position, item, reason):
+    session_id = item['session_id']
+    amount_pence = item['amount_pence']
+    booking_id = None
+    try:
+        session = stripe.checkout.Session.retrieve(session_id)
+        booking_id = (session.metadata or {}).get('booking_id')
+        if not session.payment_intent:
+            raise ValueError('Session has no payment to refund')
+
+        refund_data = {'payment_intent': session.payment_intent, 'reason': reason}
+        if amount_pence is not None:
+            refund_data['amount'] = amount_pence
+        refund = stripe.Refund.create(
+            **refund_data, idempotency_key=refund_idempotency_key(batch_key, session_id, amount_pence)
+        )
+    except Exception as e:
+        _finish_item(job_id, position, status='failed', booking_id=booking_id, error=str(e))
+        return
+
+    _finish_item(
+        job_id, position, status='succeeded', booking_id=booking_id, paid_pence=session.amount_total,
+        refund_id=refund.id, refunded_pence=refund.amount, refund_status=refund.status,
+        full_refund=session.amount_total is None or refund.amount >= session.amount_total
+    )
+
+
+def _finish_item(job_id, position, status, booking_id=None, paid_pence=None, refund_id=None,
+                 refunded_pence=None, refund_status=None, full_refund=None, error=None):
+    with transaction() as conn:
+        conn.execute(
+            '''UPDATE refund_items SET status = ?, booking_id = ?, paid_pence = ?, refund_id = ?,
+                   refunded_pence = ?, refund_status = ?, full_refund = ?, error = ?, finished_at = ?
+               WHERE job_id = ? AND position = ?''',
+            (status, booking_id, paid_pence, refund_id, refunded_pence, refund_status,
+             None if full_refund is None else int(full_refund), error, time.time(), job_id, position)
+        )
+
+
+def _update_bookings(job_id):
+    """
+    Mark every fully refunded booking in the job with one Supabase update.
+    Partly refunded bookings still stand, so they keep their status; the
+    partial refunds are recorded on the job's items.
+    """
+    rows = get_connection().execute(
+        '''SELECT DISTINCT booking_id FROM refund_items
+           WHERE job_id = ? AND status = 'succeeded' AND full_refund = 1 AND booking_id IS NOT NULL''',
+        (job_id,)
+    ).fetchall()
+    booking_ids = [row['booking_id'] for row in rows]
+    if not booking_ids:
+        return 0
+
+    changes = {'status': REFUNDED_STATUS}
+    supabase = get_supabase()
+    if supabase:
+        queued = not upstream_available('bookings')
+        if not queued:
+            try:
+                supabase.table('bookings').update(changes).in_('id', booking_ids).execute()
+            except CircuitOpenError:
+                queued = True
+        if queued:
+            # Supabase is down; the outbox flusher applies these once it is back
+            for booking_id in booking_ids:
+                queue_booking_update(booking_id, changes)
+
+    for booking_id in booking_ids:
+        publish('refunded', dict(changes, id=booking_id))
+    return len(booking_ids)
+
+
+def get_refund_job(job_id):
+    """
+    The job with per-item progress and results, or None
+    """
+    ensure_schema(SCHEMA)
+    conn = get_connection()
+    job = conn.execute('SELECT * FROM refund_jobs WHERE id = ?', (job_id,)).fetchone()
+    if job is None:
+        return None
+
+    items = conn.execute(
+        'SELECT * FROM refund_items WHERE job_id = ? ORDER BY position', (job_id,)
+    ).fetchall()
+    counts = {'pending': 0, 'succeeded': 0, 'failed': 0}
+    partial = 0
+    results = []
+    for item in items:
+        counts[item['status']] += 1
+        if item['status'] == 'succeeded' and not item['full_refund']:
+            partial += 1
+        results.append({
+            'session_id': item['session_id'],
+            'booking_id': item['booking_id'],
+            'status': item['status'],
+            'requested_amount': item['amount_pence'] / 100 if item['amount_pence'] is not None else None,
+            'paid_amount': item['paid_pence'] / 100 if item['paid_pence'] is not None else None,
+            'full_refund': None if item['full_refund'] is None else bool(item['full_refund']),
+            'refund_id': item['refund_id'],
+            'refunded_amount': item['refunded_pence'] / 100 if item['refunded_pence'] is not None else None,
+            'refund_status': item['refund_status'],
+            'error': item['error']
+        })
+
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'reason': job['reason'],
+        'total': len(items),
+        'completed': counts['succeeded'] + counts['failed'],
+        'succeeded': counts['succeeded'],
+        'failed': counts['failed'],
+        'partial_refunds': partial,
+        'bookings_updated': job['bookings_updated'],
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'finished_at': job['finished_at'],
+        'items': results
+    }
+
+
+# Checks at startup and then every minute for jobs whose worker has gone
+refund_job_worker = BackgroundWorker('refund-jobs', resume_refund_jobs, interval=60)
+
+
+def start_refund_jobs():
+    refund_job_worker.start()
@@ -0,0 +1,52 @@
+import threading
+from src.services.metrics import COALESCED_REQUESTS
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function and everyone who asks while it is running gets its result.
+    """
+
+    def __init__(self, name, timeout=10):
+        self.name = name
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """
+        Return fn() for key, sharing an in-flight call if there is one.
+        Callers that join a call wait at most timeout seconds for it.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            COALESCED_REQUESTS.inc(self.name)
+            if not call.done.wait(self.timeout if timeout is None else timeout):
+                raise TimeoutError(f'Timed out waiting for {self.name} {key}')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
@@ -0,0 +1,123 @@
+import os
+import re
+import hashlib
+import mimetypes
+from flask import Response, request
+from src.services.compression import ENCODINGS, choose_encoding, compress, encoded_etag, etag_matches
+
+# Precompressed variants are written here once and reused by later workers
+STATIC_CACHE_DIR = os.getenv(
+    'STATIC_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'static')
+)
+
+# Vite puts an 8-character content hash in every file it builds into
+# assets/, e.g. assets/index-DcSMuz7c.js. Requiring a capital or digit keeps
+# names like assets/logo-original.png out; a hash that happens to be all
+# lower case just gets the ordinary cache lifetime.
+HASHED_NAME = re.compile(r'^assets/[^/]+-(?=[a-z_-]*[A-Z0-9])[A-Za-z0-9_-]{8}\.[a-z0-9]+$')
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+DEFAULT_CACHE = 'public, max-age=3600'
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/javascript', 'application/json', 'image/svg+xml',
+    'image/x-icon', 'image/vnd.microsoft.icon', 'application/manifest+json'
+)
+MIN_COMPRESS_SIZE = 1024
+
+
+class StaticFile:
+    """
+    One file from the static tree with its compressed variants
+    """
+
+    def __init__(self, path, rel_path, data):
+        self.path = path
+        self.rel_path = rel_path
+        self.mimetype = mimetypes.guess_type(rel_path)[0] or 'application/octet-stream'
+        self.digest = hashlib.sha256(data).hexdigest()[:20]
+        self.variants = {'identity': data}
+
+        if HASHED_NAME.match(rel_path):
+            self.cache_control = IMMUTABLE_CACHE
+        elif rel_path == 'index.html':
+            self.cache_control = REVALIDATE_CACHE
+        else:
+            self.cache_control = DEFAULT_CACHE
+
+        if len(data) >= MIN_COMPRESS_SIZE and self.mimetype.startswith(COMPRESSIBLE_TYPES):
+            for encoding in ENCODINGS:
+                self._add_variant(encoding, data)
+
+    def _add_variant(self, encoding, data):
+        suffix = {'gzip': 'gz', 'br': 'br'}[encoding]
+        cache_path = os.path.join(STATIC_CACHE_DIR, f'{self.digest}.{suffix}')
+
+        try:
+            with open(cache_path, 'rb') as f:
+                compressed = f.read()
+        except OSError:
+            compressed = compress(data, encoding, best=True)
+            try:
+                os.makedirs(STATIC_CACHE_DIR, exist_ok=True)
+                tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(compressed)
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                print(f"Could not cache {encoding} variant of {self.rel_path}: {e}")
+
+        # Only worth serving if it actually saves bytes
+        if len(compressed) < len(data):
+            self.variants[encoding] = compressed
+
+    def etag(self, encoding):
+        return encoded_etag(f'"{self.digest}"', encoding)
+
+
+class StaticIndex:
+    """
+    In-memory index of the static tree, built once at startup so requests
+    never touch the filesystem
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.files = {}
+        if root and os.path.isdir(root):
+            self._build()
+
+    def _build(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for filename in filenames:
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(path, self.root).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    self.files[rel_path] = StaticFile(path, rel_path, f.read())
+
+    def get(self, rel_path):
+        return self.files.get(rel_path)
+
+    def response(self, static_file):
+        """
+        Serve the best variant the client accepts, or a 304 if it already has it
+        """
+        encoding = choose_encoding(available=static_file.variants)
+        headers = {
+            'ETag': static_file.etag(encoding),
+            'Cache-Control': static_file.cache_control,
+            'Vary': 'Accept-Encoding'
+        }
+
+        if etag_matches(static_file.etag('identity'), request.headers.get('If-None-Match')):
+            return Response(status=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+
+        return Response(static_file.variants[encoding], mimetype=static_file.mimetype, headers=headers)
@@ -0,0 +1,241 @@
+import os
+import re
+import time
+import uuid
+from src.config.supabase import get_supabase
+from src.config.stripe_client import stripe
+from src.services.background import BackgroundWorker
+from src.services.booking_events import publish
+from src.services.checkout_sessions import mark_session
+from src.services.circuit_breaker import upstream_available
+from src.services.local_db import ensure_schema, get_connection, transaction
+from src.services.payment_state import record_payment
+
+# Catches bookings whose payment webhook never arrived: pages through Stripe
+# Checkout sessions and marks paid ones' bookings as paid in Supabase.
+#
+# The checkpoint is the creation time before which every session is settled
+# (paid or expired), so a run only lists sessions from there on. Open
+# sessions hold the checkpoint back until they settle, which for card
+# payments Stripe does within a day. The page cursor is saved as the run
+# goes, so a run that is cut short resumes where it stopped.
+RECONCILE_INTERVAL_SECONDS = int(os.getenv('RECONCILE_INTERVAL_SECONDS', '300'))
+# How far back the very first run looks
+RECONCILE_LOOKBACK_DAYS = int(os.getenv('RECONCILE_LOOKBACK_DAYS', '30'))
+PAGE_SIZE = 100
+CHECKPOINT = 'checkout_sessions'
+
+_SESSION_ID = re.compile(r'^cs_[A-Za-z0-9_]+$')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stripe_reconcile (
+    name TEXT PRIMARY KEY,
+    settled_before INTEGER NOT NULL,
+    run_floor INTEGER,
+    cursor TEXT,
+    oldest_open INTEGER,
+    newest INTEGER,
+    claimed_at REAL,
+    finished_at REAL,
+    sessions_checked INTEGER NOT NULL DEFAULT 0,
+    bookings_fixed INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+'''
+
+
+def _checkpoint():
+    ensure_schema(SCHEMA)
+    conn = get_connection()
+    conn.execute(
+        'INSERT OR IGNORE INTO stripe_reconcile (name, settled_before) VALUES (?, ?)',
+        (CHECKPOINT, int(time.time()) - RECONCILE_LOOKBACK_DAYS * 86400)
+    )
+    return conn.execute('SELECT * FROM stripe_reconcile WHERE name = ?', (CHECKPOINT,)).fetchone()
+
+
+def _claim_run():
+    """
+    True if this process should reconcile now; one process per interval does
+    """
+    _checkpoint()
+    now = time.time()
+    with transaction() as conn:
+        row = conn.execute('SELECT claimed_at FROM stripe_reconcile WHERE name = ?', (CHECKPOINT,)).fetchone()
+        if row['claimed_at'] is not None and now - row['claimed_at'] < RECONCILE_INTERVAL_SECONDS:
+            return False
+        conn.execute('UPDATE stripe_reconcile SET claimed_at = ? WHERE name = ?', (now, CHECKPOINT))
+    return True
+
+
+def _save_progress(**fields):
+    assignments = ', '.join(f'{column} = ?' for column in fields)
+    with transaction() as conn:
+        conn.execute(
+            f'UPDATE stripe_reconcile SET {assignments} WHERE name = ?',
+            list(fields.values()) + [CHECKPOINT]
+        )
+
+
+def _booking_id(session):
+    """
+    The session's metadata.booking_id as a UUID string, or None if it is
+    missing or isn't one (it comes from Stripe, so it goes into a filter
+    only once it is known to be safe)
+    """
+    value = (session.metadata or {}).get('booking_id')
+    if not value:
+        return None
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+
+def _load_bookings(supabase, sessions):
+    """
+    The bookings these sessions belong to, found by metadata.booking_id or
+    by stripe_session_id, in one query
+    """
+    booking_ids = sorted({_booking_id(s) for s in sessions} - {None})
+    session_ids = [s.id for s in sessions if _SESSION_ID.match(s.id)]
+    conditions = []
+    if session_ids:
+        conditions.append('stripe_session_id.in.(' + ','.join(f'"{i}"' for i in session_ids) + ')')
+    if booking_ids:
+        conditions.append('id.in.(' + ','.join(f'"{i}"' for i in booking_ids) + ')')
+    if not conditions:
+        return []
+    result = supabase.table('bookings').select('id,status,deposit_paid,stripe_session_id').or_(','.join(conditions)).execute()
+    return result.data
+
+
+def fix_paid_sessions(supabase, sessions):
+    """
+    Mark the bookings of paid sessions as paid where Supabase missed it,
+    recording each one's own session and deposit. Returns the number fixed.
+    """
+    paid = [s for s in sessions if s.payment_status == 'paid']
+    if not paid:
+        return 0
+
+    by_booking = {}
+    by_session = {}
+    for session in paid:
+        record_payment(session)
+        mark_session(session.id, 'complete')
+        booking_id = _booking_id(session)
+        if booking_id:
+            by_booking[booking_id] = session
+        elif (session.metadata or {}).get('booking_id'):
+            # Still matched by stripe_session_id if a booking has it
+            print(f"Reconcile: session {session.id} has an invalid booking_id {session.metadata['booking_id']!r}")
+        by_session[session.id] = session
+
+    unpaid = []
+    matched = set()
+    for booking in _load_bookings(supabase, paid):
+        session = by_booking.get(str(booking['id'])) or by_session.get(booking.get('stripe_session_id'))
+        if session is None:
+            continue
+        matched.add(session.id)
+        if booking.get('deposit_paid'):
+            continue
+        print(f"Reconcile: booking {booking['id']} was paid in Stripe ({session.id}) but not marked paid")
+        unpaid.append((str(booking['id']), session))
+
+    for session in paid:
+        if session.id not in matched:
+            # Skipped rather than retried, so it can't hold up the checkpoint
+            print(f"Reconcile: paid session {session.id} matches no booking")
+
+    for booking_id, session in unpaid:
+        update_data = {
+            'deposit_paid': True,
+            'status': 'deposit_paid',
+            'deposit_amount': session.amount_total / 100,
+            'stripe_session_id': session.id
+        }
+        supabase.table('bookings').update(update_data).eq('id', booking_id).execute()
+        publish('paid', dict(update_data, id=booking_id))
+
+    return len(unpaid)
+
+
+def reconcile():
+    """
+    Check every session created since the checkpoint, page by page
+    """
+    supabase = get_supabase()
+    if not supabase or not os.getenv('STRIPE_SECRET_KEY') or not upstream_available('bookings'):
+        return 0
+
+    state = _checkpoint()
+    resuming = state['cursor'] is not None
+    floor = state['run_floor'] if resuming else state['settled_before']
+    cursor = state['cursor'] if resuming else None
+    oldest_open = state['oldest_open'] if resuming else None
+    newest = state['newest'] if resuming else None
+    checked = fixed = 0
+
+    while True:
+        params = {'limit': PAGE_SIZE, 'created': {'gte': floor}}
+        if cursor:
+            params['starting_after'] = cursor
+        page = stripe.checkout.Session.list(**params)
+        if not page.data:
+            break
+
+        fixed += fix_paid_sessions(supabase, page.data)
+        checked += len(page.data)
+        for session in page.data:
+            # Delayed payment methods can leave a completed session unpaid for days
+            if session.status == 'open' or session.payment_status == 'unpaid' and session.status == 'complete':
+                oldest_open = session.created if oldest_open is None else min(oldest_open, session.created)
+            newest = session.created if newest is None else max(newest, session.created)
+
+        cursor = page.data[-1].id
+        _save_progress(run_floor=floor, cursor=cursor, oldest_open=oldest_open, newest=newest)
+        if not page.has_more:
+            break
+
+    # Sessions created in the same second as the newest one are listed
+    # again next time, in case more arrived after this run listed them
+    settled_before = oldest_open if oldest_open is not None else (newest if newest is not None else floor)
+    _save_progress(
+        settled_before=max(settled_before, state['settled_before']), run_floor=None, cursor=None,
+        oldest_open=None, newest=None, finished_at=time.time(),
+        sessions_checked=checked, bookings_fixed=fixed, last_error=None
+    )
+    return fixed
+
+
+def run_reconcile():
+    if not _claim_run():
+        return False
+    try:
+        reconcile()
+    except Exception as e:
+        print(f"Stripe reconciliation failed: {e}")
+        _save_progress(last_error=str(e))
+    return False
+
+
+def reconcile_stats():
+    state = _checkpoint()
+    return {
+        'settled_before': state['settled_before'],
+        'resuming_after': state['cursor'],
+        'last_run': state['finished_at'],
+        'sessions_checked': state['sessions_checked'],
+        'bookings_fixed': state['bookings_fixed'],
+        'last_error': state['last_error']
+    }
+
+
+# Wakes often but only runs when this process wins the interval's claim
+reconcile_worker = BackgroundWorker('stripe-reconcile', run_reconcile, interval=60)
+
+
+def start_reconciliation():
+    reconcile_worker.start()
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+from src.services.background import BackgroundWorker
+from src.services.circuit_breaker import CircuitOpenError
+from src.services.local_db import ensure_schema, get_connection, transaction
+
+# Verified Stripe events are stored here and applied by background workers,
+# so the webhook can answer Stripe straight away
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '2'))
+MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 600
+STALE_LOCK_SECONDS = 300
+RETENTION_SECONDS = 7 * 24 * 3600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stripe_events (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    locked_at REAL,
+    last_error TEXT,
+    received_at REAL NOT NULL,
+    processed_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_stripe_events_due ON stripe_events (status, next_attempt_at);
+'''
+
+_handlers = {}
+
+
+def webhook_handler(event_type):
+    """
+    Register a function to apply events of the given type; it is called
+    with the event's data.object
+    """
+    def register(fn):
+        _handlers[event_type] = fn
+        return fn
+    return register
+
+
+def enqueue_event(event_id, event_type, payload):
+    """
+    Store a verified event. Returns False if the event was already received,
+    in which case Stripe is retrying a delivery we already have.
+    """
+    ensure_schema(SCHEMA)
+    now = time.time()
+    cursor = get_connection().execute(
+        'INSERT OR IGNORE INTO stripe_events (id, type, payload, next_attempt_at, received_at) VALUES (?, ?, ?, ?, ?)',
+        (event_id, event_type, payload, now, now)
+    )
+    if cursor.rowcount:
+        webhook_worker.wake()
+        return True
+    return False
+
+
+def _claim_event():
+    now = time.time()
+    with transaction() as conn:
+        row = conn.execute(
+            '''SELECT id, type, payload, attempts FROM stripe_events
+               WHERE (status = 'pending' AND next_attempt_at <= ?)
+                  OR (status = 'processing' AND locked_at < ?)
+               ORDER BY received_at LIMIT 1''',
+            (now, now - STALE_LOCK_SECONDS)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE stripe_events SET status = 'processing', locked_at = ? WHERE id = ?", (now, row['id']))
+        return row
+
+
+def _finish_event(event_id, attempts, error=None):
+    conn = get_connection()
+    if error is None:
+        conn.execute(
+            "UPDATE stripe_events SET status = 'done', attempts = ?, last_error = NULL, processed_at = ? WHERE id = ?",
+            (attempts, time.time(), event_id)
+        )
+    elif attempts >= MAX_ATTEMPTS:
+        print(f"Giving up on Stripe event {event_id} after {attempts} attempts: {error}")
+        conn.execute(
+            "UPDATE stripe_events SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+            (attempts, error, event_id)
+        )
+    else:
+        delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempts)
+        conn.execute(
+            "UPDATE stripe_events SET status = 'pending', attempts = ?, last_error = ?, next_attempt_at = ? WHERE id = ?",
+            (attempts, error, time.time() + delay, event_id)
+        )
+
+
+def process_next_event():
+    """
+    Apply one due event. Returns True if an event was processed.
+    """
+    ensure_schema(SCHEMA)
+    row = _claim_event()
+    if row is None:
+        _prune()
+        return False
+
+    attempts = row['attempts'] + 1
+    handler = _handlers.get(row['type'])
+    try:
+        if handler:
+            event = json.loads(row['payload'])
+            handler(event['data']['object'])
+        _finish_event(row['id'], attempts)
+    except CircuitOpenError as e:
+        _defer_event(row['id'], e)
+    except Exception as e:
+        _finish_event(row['id'], attempts, str(e))
+    return True
+
+
+def _defer_event(event_id, error):
+    # Supabase is known to be down; wait for the breaker without using up an attempt
+    get_connection().execute(
+        "UPDATE stripe_events SET status = 'pending', last_error = ?, next_attempt_at = ? WHERE id = ?",
+        (str(error), time.time() + error.retry_after, event_id)
+    )
+
+
+def _prune():
+    get_connection().execute(
+        "DELETE FROM stripe_events WHERE status = 'done' AND processed_at < ?",
+        (time.time() - RETENTION_SECONDS,)
+    )
+
+
+def queue_stats():
+    ensure_schema(SCHEMA)
+    rows = get_connection().execute('SELECT status, COUNT(*) AS count FROM stripe_events GROUP BY status').fetchall()
+    return {row['status']: row['count'] for row in rows}
+
+
+webhook_worker = BackgroundWorker('stripe-webhooks', process_next_event, interval=5, threads=WEBHOOK_WORKERS)
+
+
+def start_webhook_workers():
+    ensure_schema(SCHEMA)
+    webhook_worker.start()